@@ -0,0 +1,190 @@
+"""
+Load benchmark for the voting endpoints.
+
+Simulated voters each load the ballot page (/voting/, which sets the CSRF
+cookie and lists the candidate ids) and then submit ballots to
+/voting/submit/ back to back. A sampler polls /voting/results/ meanwhile, so
+results latency can be read against turnout. The report is JSON, meant to be
+saved per release and diffed.
+
+Run it against a local server backed by a throwaway MongoDB, never a live
+election database, e.g.:
+
+    docker run --rm -p 27017:27017 mongo
+    python manage.py migrate && python manage.py runserver --noreload
+    python benchmark.py --voters 50 --ballots 200 --output bench.json
+
+Settings such as VOTING_GROUP_COMMIT or VOTE_STORAGE_MODE are read by the
+server, so set them there to compare configurations. Start it with
+VOTING_ADMISSION_CONTROL=False to measure raw capacity: otherwise ballots
+shed with 429/503 show up as errors and the report measures admission
+control instead.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+CANDIDATE_ID_PATTERN = re.compile(r"selectPreference\(1, '([^']+)'")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Throughput, error rate and latency percentiles (ms) for (latency, ok) samples"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'throughput_per_second': len(samples) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'max': latencies[-1] if latencies else None,
+        },
+    }
+
+
+class Voter:
+    """One kiosk session with its own cookies"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        # Each simulated voter is its own kiosk for the server's admission control
+        self.kiosk_id = uuid.uuid4().hex
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def request(self, path, body=None, headers=None):
+        """Returns (latency seconds, ok, response body)"""
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content = response.read()
+                ok = 200 <= response.status < 300
+        except (urllib.error.URLError, OSError):
+            content, ok = b'', False
+        return time.perf_counter() - start, ok, content
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def load_ballot(self):
+        latency, ok, content = self.request('/voting/')
+        return latency, ok, CANDIDATE_ID_PATTERN.findall(content.decode('utf-8', 'replace'))
+
+    def submit(self, candidate_ids):
+        chosen = random.sample(candidate_ids, min(len(candidate_ids), random.randint(1, 3)))
+        body = json.dumps({
+            'preferences': {str(rank): c_id for rank, c_id in enumerate(chosen, start=1)},
+            'submission_id': uuid.uuid4().hex,
+        }).encode()
+        latency, ok, content = self.request('/voting/submit/', body, {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': self.csrf_token(),
+            'X-Kiosk-Id': self.kiosk_id,
+        })
+        if ok:
+            ok = json.loads(content or b'{}').get('status') == 'success'
+        return latency, ok
+
+
+def run(base_url, voters, ballots, results_interval, timeout):
+    page_samples, submit_samples, results_samples = [], [], []
+    lock = threading.Lock()
+    submitted = [0]
+    done = threading.Event()
+
+    def vote(voter):
+        latency, ok, candidate_ids = voter.load_ballot()
+        with lock:
+            page_samples.append((latency, ok))
+        if not candidate_ids:
+            return
+        for _ in range(ballots):
+            latency, ok = voter.submit(candidate_ids)
+            with lock:
+                submit_samples.append((latency, ok))
+                submitted[0] += ok
+
+    def sample_results():
+        viewer = Voter(base_url, timeout)
+        while not done.wait(results_interval):
+            latency, ok, _ = viewer.request('/voting/results/')
+            with lock:
+                results_samples.append((submitted[0], latency, ok))
+
+    sampler = threading.Thread(target=sample_results, daemon=True)
+    threads = [threading.Thread(target=vote, args=(Voter(base_url, timeout),)) for _ in range(voters)]
+    start = time.perf_counter()
+    sampler.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    if not submit_samples:
+        raise SystemExit('No ballots submitted: is the server running and are there candidates?')
+    # Admission counters of whichever server process answers (submissions shed with 429/503 count as errors above)
+    _, ok, content = Voter(base_url, timeout).request('/voting/api/admission/')
+    return {
+        'config': {
+            'url': base_url, 'voters': voters, 'ballots_per_voter': ballots,
+            'results_interval_seconds': results_interval,
+        },
+        'elapsed_seconds': elapsed,
+        'ballot_page': summarize(page_samples, elapsed),
+        'submit_vote': summarize(submit_samples, elapsed),
+        'results': dict(
+            summarize([(latency, ok) for _, latency, ok in results_samples], elapsed),
+            # (ballots accepted so far, latency ms) to see latency grow with turnout
+            by_turnout=[[turnout, latency * 1000] for turnout, latency, _ in results_samples],
+        ),
+        'admission': json.loads(content) if ok else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL')
+    parser.add_argument('--voters', type=int, default=20, help='Concurrent simulated voters')
+    parser.add_argument('--ballots', type=int, default=50, help='Ballots submitted per voter')
+    parser.add_argument('--results-interval', type=float, default=1.0,
+                        help='Seconds between results page samples')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = run(args.url, args.voters, args.ballots, args.results_interval, args.timeout)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from candidates.models import Candidate
+from candidates.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate missing candidate photo thumbnails (e.g. for candidates registered before thumbnails existed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate thumbnails that already exist")
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for candidate in Candidate.objects.only('id', 'candidate_photo', 'photo_thumbnails'):
+            if not candidate.candidate_photo:
+                continue
+            if not options['force'] and candidate.thumbnails:
+                continue
+            try:
+                generate_thumbnails(candidate)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"{candidate.pk}: {e}"))
+        self.stdout.write(self.style.SUCCESS(f"Generated thumbnails for {generated} candidates ({failed} failed)"))
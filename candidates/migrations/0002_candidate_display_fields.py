@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from candidates.models import display_fields
+
+
+def fill_display_fields(apps, schema_editor):
+    Candidate = apps.get_model("candidates", "Candidate")
+    candidates = list(Candidate.objects.only("id", "full_name", "party_name"))
+    for candidate in candidates:
+        for field, value in display_fields(candidate.full_name, candidate.party_name).items():
+            setattr(candidate, field, value)
+    Candidate.objects.bulk_update(candidates, ["short_name", "color", "party_symbol_url"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("candidates", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="candidate",
+            name="short_name",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="candidate",
+            name="color",
+            field=models.CharField(default="#666666", editable=False, max_length=7),
+        ),
+        migrations.AddField(
+            model_name="candidate",
+            name="party_symbol_url",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(fill_display_fields, migrations.RunPython.noop),
+    ]
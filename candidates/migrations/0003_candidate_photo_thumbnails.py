@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("candidates", "0002_candidate_display_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="candidate",
+            name="photo_thumbnails",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -1,7 +1,46 @@
+from django.conf import settings
 from django.db import models
 from django.core.exceptions import ValidationError
 from datetime import date
 
+PARTY_COLORS = {
+    "SJB": "#008000", # Green
+    "UNP": "#008000", # Green
+    "SLPP": "#800000", # Maroon
+    "NPP": "#cc0000", # Red
+    "SLFP": "#0000FF", # Blue
+    "Independent": "#808080" # Grey
+}
+
+# Party symbol image filenames under MEDIA_ROOT/party_symbols/
+PARTY_SYMBOLS = {
+    "SJB": "SJB.png",
+    "SLPP": "SLPP.png",
+    "NPP": "NPP.png",
+    "SLFP": "SLFP.png",
+    "UNP": "Democratic United National Front.png",  # Assuming UNP uses this
+    "MJP": "MJP.png",
+}
+
+def get_party_color(party_name):
+    return PARTY_COLORS.get(party_name, "#666666")
+
+def get_party_symbol(party_name):
+    """Map party names to their symbol image filenames"""
+    return PARTY_SYMBOLS.get(party_name, None)
+
+def display_fields(full_name, party_name):
+    """Ballot display attributes derived from a candidate's name and party"""
+    # Short English name (first and last name only)
+    name_parts = full_name.split()
+    short_name = f"{name_parts[0]} {name_parts[-1]}" if len(name_parts) >= 2 else full_name
+    symbol_filename = get_party_symbol(party_name)
+    return {
+        'short_name': short_name,
+        'color': get_party_color(party_name),
+        'party_symbol_url': f"{settings.MEDIA_URL}party_symbols/{symbol_filename}" if symbol_filename else None,
+    }
+
 def validate_age(dob):
     today = date.today()
     # Calculate age
@@ -85,6 +124,19 @@ class Candidate(models.Model):
     
     submission_date = models.DateTimeField(auto_now_add=True)
 
+    # Ballot display attributes, derived on save (see display_fields) so the
+    # ballot and results pages can read them with a narrow projection
+    short_name = models.CharField(max_length=255, blank=True, editable=False)
+    color = models.CharField(max_length=7, default="#666666", editable=False)
+    party_symbol_url = models.CharField(max_length=255, blank=True, null=True, editable=False)
+    # Names of the photo's fixed-size derivatives, written by the thumbnail
+    # worker: {'source': photo name, size: {fmt: name}} (see thumbnails.py)
+    photo_thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Columns the ballot page renders
+    BALLOT_FIELDS = ('id', 'ballot_name', 'short_name', 'party_name', 'color', 'party_symbol_url',
+                     'candidate_photo', 'photo_thumbnails')
+
     def clean(self):
         errors = {}
         # Nomination Logic Validation
@@ -120,8 +172,24 @@ class Candidate(models.Model):
         if errors:
             raise ValidationError(errors)
 
+    @property
+    def thumbnails(self):
+        """{size: {fmt: url}} of the current photo's thumbnails; empty until they are generated"""
+        if not self.candidate_photo or self.photo_thumbnails.get('source') != self.candidate_photo.name:
+            return {}
+        storage = self.candidate_photo.storage
+        return {
+            size: {fmt: storage.url(name) for fmt, name in formats.items()}
+            for size, formats in self.photo_thumbnails.items() if size != 'source'
+        }
+
+    def update_display_fields(self):
+        for field, value in display_fields(self.full_name, self.party_name).items():
+            setattr(self, field, value)
+
     def save(self, *args, **kwargs):
         self.full_clean()
+        self.update_display_fields()
         # For new instances, ensure we don't explicitly set id=None
         # Let MongoDB backend auto-generate the ObjectId
         super().save(*args, **kwargs)
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Candidate
+from .thumbnails import schedule_thumbnails
+
+
+@receiver(post_save, sender=Candidate)
+def generate_photo_thumbnails(sender, instance, **kwargs):
+    schedule_thumbnails(instance)
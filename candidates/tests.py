@@ -1,8 +1,11 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.core.exceptions import ValidationError
 from datetime import date, timedelta
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Candidate
+from io import BytesIO
+from PIL import Image
+from .models import Candidate, display_fields
+from .thumbnails import THUMBNAIL_SIZES, render_thumbnails
 
 class CandidateModelTest(TestCase):
     def setUp(self):
@@ -98,3 +101,40 @@ class CandidateModelTest(TestCase):
             candidate.save()
         except ValidationError:
             self.fail("Valid candidate raised ValidationError")
+
+
+class DisplayFieldsTest(SimpleTestCase):
+    def test_party_candidate(self):
+        fields = display_fields("Sajith Hemantha Premadasa", "SJB")
+        self.assertEqual(fields['short_name'], "Sajith Premadasa")
+        self.assertEqual(fields['color'], "#008000")
+        self.assertTrue(fields['party_symbol_url'].endswith("party_symbols/SJB.png"))
+
+    def test_independent_candidate(self):
+        self.assertEqual(
+            display_fields("Mononym", None),
+            {'short_name': "Mononym", 'color': "#666666", 'party_symbol_url': None},
+        )
+
+
+class ThumbnailTest(SimpleTestCase):
+    def test_render_every_size_and_format(self):
+        photo = BytesIO()
+        Image.new('RGB', (1200, 1600), 'red').save(photo, 'PNG')
+        photo.seek(0)
+        rendered = render_thumbnails(photo)
+        for size, dimensions in THUMBNAIL_SIZES.items():
+            for fmt, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with Image.open(BytesIO(rendered[size][fmt])) as image:
+                    self.assertEqual((image.format, image.size), (pil_format, dimensions))
+
+    def test_urls_only_for_current_photo(self):
+        candidate = Candidate(candidate_photo='candidate_photos/a.png', photo_thumbnails={
+            'source': 'candidate_photos/a.png',
+            'ballot': {'webp': 'candidate_photos/a.ballot.webp', 'jpeg': 'candidate_photos/a.ballot.jpg'},
+        })
+        self.assertEqual(candidate.thumbnails, {
+            'ballot': {'webp': '/media/candidate_photos/a.ballot.webp', 'jpeg': '/media/candidate_photos/a.ballot.jpg'},
+        })
+        candidate.candidate_photo = 'candidate_photos/b.png'
+        self.assertEqual(candidate.thumbnails, {})
@@ -0,0 +1,108 @@
+"""
+Fixed-size derivatives of candidate photos.
+
+When a candidate is saved with a new photo, a background thread crops and
+resizes it once per entry in THUMBNAIL_SIZES and stores WebP and JPEG
+copies next to the original ('candidate_photos/x.ballot.webp', ...). Their
+names are recorded in Candidate.photo_thumbnails, so pages link straight to
+a small image and nobody downloads or resizes the full-resolution upload.
+Until the worker has run, templates fall back to the original.
+"""
+import logging
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+from election_portal.workers import QueueWorker
+
+logger = logging.getLogger(__name__)
+
+# (width, height) of each derivative; 2x the CSS size where the page scales it down
+THUMBNAIL_SIZES = {
+    'ballot': (360, 400),   # index.html candidate card
+    'kiosk': (120, 90),     # vote.py candidate card
+    'results': (64, 64),    # results table row
+}
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+# Sent with `candidate_id` once a candidate's thumbnails are stored
+thumbnails_ready = Signal()
+
+def thumbnail_name(source_name, size, fmt):
+    stem, _ = os.path.splitext(source_name)
+    return f"{stem}.{size}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+def render_thumbnails(photo):
+    """{size: {fmt: bytes}} for an open image file"""
+    with Image.open(photo) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    rendered = {}
+    for size, dimensions in THUMBNAIL_SIZES.items():
+        # Crop to the card's aspect ratio, like CSS object-fit: cover
+        thumbnail = ImageOps.fit(image, dimensions, Image.Resampling.LANCZOS)
+        rendered[size] = {}
+        for fmt, (pil_format, options) in THUMBNAIL_FORMATS.items():
+            buf = BytesIO()
+            thumbnail.save(buf, pil_format, **options)
+            rendered[size][fmt] = buf.getvalue()
+    return rendered
+
+def generate_thumbnails(candidate):
+    """Render and store the thumbnails of a candidate's current photo; returns photo_thumbnails"""
+    from .models import Candidate
+    photo = candidate.candidate_photo
+    storage = photo.storage
+    with photo.open('rb') as f:
+        rendered = render_thumbnails(f)
+    names = {}
+    for size, formats in rendered.items():
+        names[size] = {}
+        for fmt, content in formats.items():
+            name = thumbnail_name(photo.name, size, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            names[size][fmt] = storage.save(name, ContentFile(content))
+    thumbnails = {'source': photo.name, **names}
+    # update() rather than save(): no full_clean, no post_save loop, and only
+    # if the photo hasn't been replaced meanwhile
+    if Candidate.objects.filter(pk=candidate.pk, candidate_photo=photo.name).update(photo_thumbnails=thumbnails):
+        thumbnails_ready.send(sender=Candidate, candidate_id=candidate.pk)
+    return thumbnails
+
+
+class ThumbnailWorker(QueueWorker):
+    """Generates thumbnails off the request path, one candidate at a time"""
+    thread_name = 'candidate-thumbnails'
+
+    def submit(self, candidate_id):
+        self.put(candidate_id)
+
+    def _run(self):
+        from .models import Candidate
+        while True:
+            candidate_id = self._queue.get()
+            close_old_connections()
+            try:
+                candidate = Candidate.objects.only('id', 'candidate_photo').get(pk=candidate_id)
+                generate_thumbnails(candidate)
+            except Exception:
+                # The pages keep using the original photo; generate_thumbnails can be re-run
+                logger.exception("Error generating thumbnails for candidate %s", candidate_id)
+
+
+worker = ThumbnailWorker()
+
+def schedule_thumbnails(candidate):
+    """Queue (or, without CANDIDATE_THUMBNAIL_WORKER, run) thumbnail generation if the photo changed"""
+    if not candidate.candidate_photo or candidate.photo_thumbnails.get('source') == candidate.candidate_photo.name:
+        return
+    if settings.CANDIDATE_THUMBNAIL_WORKER:
+        worker.submit(candidate.pk)
+    else:
+        generate_thumbnails(candidate)
@@ -0,0 +1,161 @@
+"""
+Media file serving (/media/) for production.
+
+Every voter's ballot fetches the same party symbols and candidate
+thumbnails, so responses carry a content-hash ETag, Last-Modified and a
+Cache-Control that is immutable for content-hashed names
+(e.g. 'sjb.3f2a9c1e04b7.png') and MEDIA_MAX_AGE otherwise; repeat fetches
+end in 304s or never leave the browser. Single byte ranges are answered with
+206. With MEDIA_SERVE_MODE = 'x-accel' (nginx) or 'x-sendfile' (Apache,
+lighttpd) Django only checks the request and the web server sends the file.
+
+MEDIA_ROOT also holds the candidates' nomination papers and asset
+declarations, so only files under MEDIA_PUBLIC_DIRS are served; anything
+else is a 404.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# A dot-separated hex segment of 8+ characters marks a content-hashed name
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.[^./]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+_etags = OrderedDict()
+_etags_lock = threading.Lock()
+
+def file_etag(path, stat):
+    """Quoted content-hash ETag, computed once per (path, mtime, size)"""
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _etags_lock:
+        etag = _etags.get(key)
+        if etag is not None:
+            _etags.move_to_end(key)
+            return etag
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    with _etags_lock:
+        _etags[key] = etag
+        while len(_etags) > settings.MEDIA_ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+def cache_control(name):
+    if HASHED_NAME.search(name):
+        return 'public, max-age=31536000, immutable'
+    return f'public, max-age={settings.MEDIA_MAX_AGE}'
+
+def byte_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None to send the whole file, or 'invalid'"""
+    match = RANGE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: serving the full file is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            return 'invalid'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+def iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(CHUNK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid media path")
+    # Checked on the normalized path, so 'party_symbols/../form_a/...' is refused too
+    path = os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+    if not path.startswith(tuple(settings.MEDIA_PUBLIC_DIRS)):
+        raise Http404("Media file not found")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Media file not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found")
+
+    etag = file_etag(full_path, stat)
+    last_modified = http_date(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': last_modified,
+        'Cache-Control': cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        if etag in parse_etags(if_none_match) or if_none_match.strip() == '*':
+            return HttpResponseNotModified(headers=headers)
+    else:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if since is not None and int(stat.st_mtime) <= since:
+            return HttpResponseNotModified(headers=headers)
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_SERVE_MODE == 'x-accel':
+        # nginx serves an `internal` location mapped onto MEDIA_ROOT, ranges included
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        return response
+    if settings.MEDIA_SERVE_MODE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Sendfile'] = full_path
+        return response
+
+    size = stat.st_size
+    requested = None
+    range_header = request.headers.get('Range')
+    # If-Range: only honour the range if the client still has this version
+    if range_header and request.headers.get('If-Range', etag) in (etag, last_modified):
+        requested = byte_range(range_header, size)
+    if requested == 'invalid':
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+    if requested is not None:
+        start, end = requested
+        length = end - start + 1
+        # Lazy: for HEAD the body is dropped without the file being opened
+        response = StreamingHttpResponse(
+            iter_range(full_path, start, length),
+            status=206,
+            content_type=content_type,
+            headers={**headers, 'Content-Range': f'bytes {start}-{end}/{size}'},
+        )
+        response['Content-Length'] = str(length)
+        return response
+
+    return FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
@@ -26,6 +26,75 @@ SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-1v_@o@rwvbz6(a
 # Encryption Key for Voting Data
 ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY', 'Avq7dnH43UU0YcC1PkbG7mQNmer_n9Jya5NSLOpFVQQ=')
 
+# Key rotation: comma-separated Fernet keys, newest first. New votes are encrypted with the first;
+# all of them can decrypt. Run `manage.py rotate_vote_keys` before removing an old key.
+ENCRYPTION_KEYS = os.environ.get('ENCRYPTION_KEYS', ENCRYPTION_KEY).split(',')
+
+# Polling location of this deployment; ballots submitted without a location are tagged with it
+VOTING_ELECTORAL_DISTRICT = os.environ.get('VOTING_ELECTORAL_DISTRICT') or None
+VOTING_POLLING_DIVISION = os.environ.get('VOTING_POLLING_DIVISION') or None
+# Other locations a client may report in a ballot, as comma-separated 'District/Division' entries;
+# ballots naming any other location are rejected, so clients can't invent regions
+VOTING_POLLING_LOCATIONS = [loc for loc in os.environ.get('VOTING_POLLING_LOCATIONS', '').split(',') if loc.strip()]
+
+# Serve /voting/submit/ with the async view; enable when running under ASGI (election_portal/asgi.py)
+VOTING_ASYNC_SUBMIT = os.environ.get('VOTING_ASYNC_SUBMIT', 'False') == 'True'
+
+# Group commit: gather concurrent submissions into one bulk insert of up to MAX_BATCH votes,
+# waiting at most MAX_WAIT_MS for the batch to fill
+VOTING_GROUP_COMMIT = os.environ.get('VOTING_GROUP_COMMIT', 'False') == 'True'
+VOTING_GROUP_COMMIT_MAX_BATCH = int(os.environ.get('VOTING_GROUP_COMMIT_MAX_BATCH', 200))
+VOTING_GROUP_COMMIT_MAX_WAIT_MS = float(os.environ.get('VOTING_GROUP_COMMIT_MAX_WAIT_MS', 10))
+# Seconds a request waits for its batch to be acknowledged before answering 503 with Retry-After (the kiosk retries safely)
+VOTING_GROUP_COMMIT_TIMEOUT = float(os.environ.get('VOTING_GROUP_COMMIT_TIMEOUT', 30))
+
+# Ballot storage: 'ballot' = one encrypted Vote per ballot; 'envelope' = each group-committed batch
+# sealed as one encrypted VoteBatch (implies group commit). Both formats are always readable.
+VOTE_STORAGE_MODE = os.environ.get('VOTE_STORAGE_MODE', 'ballot')
+
+# Idempotent submission: recently accepted submission ids remembered per process to answer retries
+VOTING_IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('VOTING_IDEMPOTENCY_CACHE_SIZE', 100000))
+
+# Ballot validation: seconds before a process reloads the candidate id set (edits in-process clear it at once)
+VOTING_CANDIDATE_IDS_MAX_AGE = float(os.environ.get('VOTING_CANDIDATE_IDS_MAX_AGE', 60))
+
+# Ballot page (/voting/) render cache; Candidate saves/deletes invalidate it, the timeout is a safety net
+# for per-process cache backends where other workers don't see the invalidation
+VOTING_BALLOT_CACHE_SECONDS = int(os.environ.get('VOTING_BALLOT_CACHE_SECONDS', 300))
+
+# Admission control for /voting/submit/ (per process): at most MAX_CONCURRENT submissions in flight with
+# up to MAX_QUEUE waiting QUEUE_TIMEOUT seconds, the rest get 503 with Retry-After. RATE > 0 adds a per-kiosk
+# token bucket (submissions per second and burst, 429 when exceeded) keyed by KEY_HEADER, else the client
+# address; it is off by default because behind a reverse proxy every voter shares one address. Only enable
+# it if KEY_HEADER is set by kiosks or a proxy you trust.
+VOTING_ADMISSION_CONTROL = os.environ.get('VOTING_ADMISSION_CONTROL', 'True') == 'True'
+VOTING_ADMISSION_KEY_HEADER = os.environ.get('VOTING_ADMISSION_KEY_HEADER', 'X-Kiosk-Id')
+VOTING_ADMISSION_RATE = float(os.environ.get('VOTING_ADMISSION_RATE', 0))
+VOTING_ADMISSION_BURST = float(os.environ.get('VOTING_ADMISSION_BURST', 10))
+VOTING_ADMISSION_MAX_CONCURRENT = int(os.environ.get('VOTING_ADMISSION_MAX_CONCURRENT', 64))
+VOTING_ADMISSION_MAX_QUEUE = int(os.environ.get('VOTING_ADMISSION_MAX_QUEUE', 128))
+VOTING_ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('VOTING_ADMISSION_QUEUE_TIMEOUT', 2))
+
+# Bulk ballot decryption (recounts): worker processes (defaults to CPU count) and tokens per chunk
+VOTE_DECRYPT_WORKERS = int(os.environ.get('VOTE_DECRYPT_WORKERS', os.cpu_count() or 1))
+VOTE_DECRYPT_CHUNK_SIZE = int(os.environ.get('VOTE_DECRYPT_CHUNK_SIZE', 5000))
+
+# Incremental tally (manage.py incremental_tally): votes per checkpointed batch, and how long
+# to hold back the newest votes so ids generated by other clients' clocks can't land behind the checkpoint
+TALLY_CHECKPOINT_BATCH_SIZE = int(os.environ.get('TALLY_CHECKPOINT_BATCH_SIZE', 50000))
+TALLY_CHECKPOINT_LAG_SECONDS = int(os.environ.get('TALLY_CHECKPOINT_LAG_SECONDS', 30))
+
+# Results page caching: how often the tally version is re-checked, and how long a rendered page is kept
+RESULTS_MIN_REFRESH_SECONDS = int(os.environ.get('RESULTS_MIN_REFRESH_SECONDS', 2))
+RESULTS_PAGE_CACHE_SECONDS = int(os.environ.get('RESULTS_PAGE_CACHE_SECONDS', 300))
+
+# Live results stream (/voting/results/stream/); enable only under ASGI: a WSGI worker would be held by each
+# viewer for good. When off, the results page reloads itself every 30 seconds instead.
+VOTING_LIVE_RESULTS = os.environ.get('VOTING_LIVE_RESULTS', 'False') == 'True'
+# How often the stream polls the tally, and its keep-alive interval
+RESULTS_STREAM_TICK_SECONDS = float(os.environ.get('RESULTS_STREAM_TICK_SECONDS', 2))
+RESULTS_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('RESULTS_STREAM_HEARTBEAT_SECONDS', 15))
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get('DJANGO_DEBUG', 'True') == 'True'
 
@@ -140,6 +209,23 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media serving (election_portal/media.py): 'django' streams files itself; 'x-accel' (nginx, via an internal
+# location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' hand the transfer to the web server.
+# Content-hashed names are cached as immutable, others for MEDIA_MAX_AGE seconds.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
+MEDIA_ETAG_CACHE_SIZE = int(os.environ.get('MEDIA_ETAG_CACHE_SIZE', 10000))
+# The only MEDIA_ROOT directories served publicly (thumbnails are stored next to the photos); nomination
+# papers, asset declarations and MP proofs are never served
+MEDIA_PUBLIC_DIRS = ['party_symbols/', 'candidate_photos/']
+
+# Generate candidate photo thumbnails in a background thread after save (False: inline, during save)
+CANDIDATE_THUMBNAIL_WORKER = os.environ.get('CANDIDATE_THUMBNAIL_WORKER', 'True') == 'True'
+
+# Output of manage.py freeze_election: static ballot/success pages and hashed assets, laid out by URL path
+VOTING_FROZEN_ROOT = os.environ.get('VOTING_FROZEN_ROOT', BASE_DIR / 'frozen')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
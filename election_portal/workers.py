@@ -0,0 +1,40 @@
+"""
+Per-process background threads fed by a queue.
+
+Used by the vote group committer and the candidate thumbnail worker. Each
+process has its own thread, started by the first put(); threads don't
+survive fork, so a forked worker process starts a fresh one, with a fresh
+queue, on its first put().
+"""
+import os
+import queue
+import threading
+
+
+class QueueWorker:
+    """Base for a daemon thread consuming self._queue; subclasses implement _run()"""
+    thread_name = 'queue-worker'
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+
+    def put(self, item):
+        """Queue `item` for the thread, starting it in this process if needed"""
+        self._ensure_running()
+        self._queue.put(item)
+
+    def _run(self):
+        raise NotImplementedError
@@ -44,13 +44,17 @@ if candidates_collection is not None:
             name = doc.get("ballot_name") or doc.get("full_name") or "Unknown"
             party = doc.get("party_name") or "Independent"
             image_path = doc.get("candidate_photo", "")
+            # Pre-sized 120x90 copy made by the server's thumbnail worker, if current
+            thumbnails = doc.get("photo_thumbnails") or {}
+            thumbnail_path = thumbnails.get("kiosk", {}).get("jpeg") if thumbnails.get("source") == image_path else None
             
             CANDIDATE_DATA.append({
                 "id": c_id,
                 "name": name,
                 "party": party,
                 "color": get_party_color(party),
-                "image": image_path
+                "image": image_path,
+                "thumbnail": thumbnail_path
             })
         print(f"Loaded {len(CANDIDATE_DATA)} candidates from DB")
     except Exception as e:
@@ -179,11 +183,18 @@ class VotingApp:
             try:
                 # Construct absolute path to media
                 # Assuming 'media' folder is in the same directory as this script or configured
+                thumb_path = os.path.join(MEDIA_DIR, candidate["thumbnail"]) if candidate.get("thumbnail") else None
                 img_path = os.path.join(MEDIA_DIR, candidate["image"])
-                if os.path.exists(img_path):
+                if thumb_path and os.path.exists(thumb_path):
+                    # Already 120x90
+                    pil_img = Image.open(thumb_path)
+                elif os.path.exists(img_path):
                     pil_img = Image.open(img_path)
                     # Resize to fit 120x90
                     pil_img = pil_img.resize((120, 90), Image.Resampling.LANCZOS)
+                else:
+                    pil_img = None
+                if pil_img is not None:
                     tk_img = ImageTk.PhotoImage(pil_img)
                     
                     img_label = tk.Label(img_frame, image=tk_img, bg="#f0f0f0")
@@ -312,7 +323,10 @@ class VotingApp:
             try:
                 vote_doc = {
                     "preferences": {str(k): v for k, v in self.preferences.items() if v}, # Store only selected
-                    "timestamp": datetime.now()
+                    "timestamp": datetime.now(),
+                    # Polling location of this kiosk, for regional results
+                    "electoral_district": os.environ.get("VOTING_ELECTORAL_DISTRICT"),
+                    "polling_division": os.environ.get("VOTING_POLLING_DIVISION"),
                 }
                 vote_collection.insert_one(vote_doc)
                 print("Vote saved to MongoDB")
@@ -0,0 +1,247 @@
+"""
+Admission control for vote submission.
+
+With VOTING_ADMISSION_RATE > 0 each kiosk (the VOTING_ADMISSION_KEY_HEADER
+request header, else the client address) gets a token bucket of that many
+submissions per second with bursts of VOTING_ADMISSION_BURST; a kiosk over
+its rate gets 429 and a Retry-After of when its next token is due. It is
+off by default: behind a reverse proxy all voters share one address.
+Admitted submissions then take one of VOTING_ADMISSION_MAX_CONCURRENT
+in-flight slots, waiting in a queue of at most VOTING_ADMISSION_MAX_QUEUE
+for up to VOTING_ADMISSION_QUEUE_TIMEOUT seconds. Anything beyond that is shed at once with 503 and a Retry-After,
+so under overload latency stays bounded and clients get a fast "retry
+shortly" instead of a timeout. Retries are safe: see idempotency.
+Async views queue on their event loop, sync views in their own thread.
+
+State is per process, like the other in-process caches; limits apply per
+worker. The kiosk header is client-supplied, so it only spreads fair
+shares between well-behaved kiosks: the in-flight limit is what protects
+the server.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token; returns 0, or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(self, rate, burst, max_concurrent, max_queue, queue_timeout, max_kiosks=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_kiosks = max_kiosks
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.counts = dict.fromkeys(('admitted', 'throttled', 'shed', 'timed_out'), 0)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.Condition(self._lock)
+        # (loop, future) of async submissions queued for a slot, oldest first
+        self._waiters = deque()
+
+    def throttle(self, key):
+        """Take a token from `key`'s bucket; returns 0, or the seconds to wait before retrying"""
+        if not self.rate:
+            return 0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                # Idle buckets are full anyway, so the least recently seen can be dropped
+                while len(self._buckets) > self.max_kiosks:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take()
+            if wait:
+                self.counts['throttled'] += 1
+            return wait
+
+    def enter(self):
+        """
+        Take an in-flight slot, blocking the thread in the queue for up to
+        queue_timeout. Returns False if the submission is shed.
+        """
+        with self._slots:
+            if self.in_flight < self.max_concurrent:
+                self.in_flight += 1
+                self.counts['admitted'] += 1
+                return True
+            if self.queued >= self.max_queue:
+                self.counts['shed'] += 1
+                return False
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                if self._slots.wait_for(lambda: self.in_flight < self.max_concurrent, self.queue_timeout):
+                    self.in_flight += 1
+                    self.counts['admitted'] += 1
+                    return True
+                self.counts['timed_out'] += 1
+                return False
+            finally:
+                self.queued -= 1
+
+    async def enter_async(self):
+        """
+        enter() for async views. The queue wait is a future on the running
+        event loop rather than a blocked thread, so queued submissions don't
+        hold the executor threads the admitted ones need to finish.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < self.max_concurrent:
+                self.in_flight += 1
+                self.counts['admitted'] += 1
+                return True
+            if self.queued >= self.max_queue:
+                self.counts['shed'] += 1
+                return False
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            return await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.counts['timed_out'] += 1
+            return False
+        except asyncio.CancelledError:
+            # The client went away just after its slot was handed over
+            if waiter.done() and not waiter.cancelled():
+                self.leave()
+            raise
+        finally:
+            with self._lock:
+                self.queued -= 1
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+
+    def leave(self):
+        """Free a slot, handing it straight to the oldest async waiter if there is one"""
+        with self._slots:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._hand_over, waiter)
+                    return
+                except RuntimeError:
+                    # Its event loop is closed
+                    continue
+            self.in_flight -= 1
+            self._slots.notify()
+
+    def _hand_over(self, waiter):
+        # Runs on the waiter's loop; the slot is still counted in flight
+        if waiter.done():
+            # Timed out or cancelled meanwhile: pass the slot on
+            self.leave()
+            return
+        with self._lock:
+            self.counts['admitted'] += 1
+        waiter.set_result(True)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'peak_queued': self.peak_queued,
+                'kiosks': len(self._buckets),
+                **self.counts,
+                'limits': {
+                    'rate': self.rate,
+                    'burst': self.burst,
+                    'max_concurrent': self.max_concurrent,
+                    'max_queue': self.max_queue,
+                    'queue_timeout': self.queue_timeout,
+                },
+            }
+
+
+controller = AdmissionController(
+    settings.VOTING_ADMISSION_RATE,
+    settings.VOTING_ADMISSION_BURST,
+    settings.VOTING_ADMISSION_MAX_CONCURRENT,
+    settings.VOTING_ADMISSION_MAX_QUEUE,
+    settings.VOTING_ADMISSION_QUEUE_TIMEOUT,
+)
+
+def kiosk_key(request):
+    return request.headers.get(settings.VOTING_ADMISSION_KEY_HEADER) or request.META.get('REMOTE_ADDR', '')
+
+def retry_response(status, message, retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    response = JsonResponse({'status': 'error', 'message': message, 'retry_after': retry_after}, status=status)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+def throttled_response(request):
+    """429 if the kiosk is over its rate, else None"""
+    wait = controller.throttle(kiosk_key(request))
+    if wait:
+        return retry_response(429, 'Too many submissions from this kiosk, retry shortly', wait)
+    return None
+
+def busy_response():
+    return retry_response(503, 'Server busy, retry shortly', controller.queue_timeout)
+
+def admission_control(view):
+    """Guard a sync or async submission view with the process's AdmissionController"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not settings.VOTING_ADMISSION_CONTROL or request.method != 'POST':
+                return await view(request, *args, **kwargs)
+            response = throttled_response(request)
+            if response:
+                return response
+            if not await controller.enter_async():
+                return busy_response()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                controller.leave()
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.VOTING_ADMISSION_CONTROL or request.method != 'POST':
+            return view(request, *args, **kwargs)
+        response = throttled_response(request)
+        if response:
+            return response
+        if not controller.enter():
+            return busy_response()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            controller.leave()
+    return wrapper
@@ -0,0 +1,70 @@
+import json
+from itertools import chain
+from django.conf import settings
+from .decryption import iter_decrypted_chunks, make_cipher, open_envelope, seal_envelope
+from .models import Vote, VoteBatch
+
+# VOTE_STORAGE_MODE values: one Fernet token per Vote, or one envelope per group-committed VoteBatch
+PER_BALLOT = 'ballot'
+ENVELOPE = 'envelope'
+
+# Initialize Fernet (MultiFernet: encrypts with the newest key, decrypts with any configured key)
+cipher_suite = make_cipher(settings.ENCRYPTION_KEYS)
+
+def encrypt_preferences(preferences):
+    """Serialize a {rank: candidate_id} dict and return it as a Fernet token string"""
+    json_str = json.dumps(preferences)
+    return cipher_suite.encrypt(json_str.encode()).decode()
+
+def decrypt_preferences(token):
+    """Inverse of encrypt_preferences; raises on tampered or foreign tokens"""
+    decrypted_data = cipher_suite.decrypt(token.encode()).decode()
+    return json.loads(decrypted_data)
+
+def seal_ballots(ballots):
+    """Encrypt a list of preference dicts as one envelope; returns (token, offsets)"""
+    return seal_envelope(cipher_suite, ballots)
+
+def open_batch(batch):
+    """Split a VoteBatch back into its ballots, e.g. for an audit"""
+    return open_envelope(cipher_suite, batch.envelope, batch.offsets)
+
+def iter_vote_tokens(chunk_size=None, **filters):
+    """
+    Stream the encrypted preferences through server-side cursors, about
+    `chunk_size` ballots at a time: per-ballot tokens from the vote collection,
+    then (token, offsets) envelopes from vote_batch. Both formats are read,
+    so votes stored before envelopes were enabled still count.
+    """
+    chunk_size = chunk_size or settings.VOTE_DECRYPT_CHUNK_SIZE
+    votes = Vote.objects.filter(**filters) if filters else Vote.objects.all()
+    batches = VoteBatch.objects.filter(**filters) if filters else VoteBatch.objects.all()
+    return chain(
+        votes.values_list('preferences', flat=True).iterator(chunk_size=chunk_size),
+        batches.values_list('envelope', 'offsets').iterator(
+            chunk_size=max(1, chunk_size // settings.VOTING_GROUP_COMMIT_MAX_BATCH)
+        ),
+    )
+
+def stream_ballots(workers=None, chunk_size=None, chunk_errors=None, pool=None, **filters):
+    """
+    Yield the decoded preferences of every stored vote in constant memory.
+
+    fetch (cursor batches) -> decrypt (process pool) -> consumer, with only a
+    few chunks in flight at a time. Undecryptable votes are skipped; pass a
+    list as `chunk_errors` to receive the number skipped in each chunk.
+    `pool` is passed on to iter_decrypted_chunks. Extra keyword arguments
+    filter the votes, e.g. electoral_district='Colombo'.
+    """
+    chunk_size = chunk_size or settings.VOTE_DECRYPT_CHUNK_SIZE
+    chunks = iter_decrypted_chunks(
+        iter_vote_tokens(chunk_size, **filters),
+        settings.ENCRYPTION_KEYS,
+        workers=workers or settings.VOTE_DECRYPT_WORKERS,
+        chunk_size=chunk_size,
+        pool=pool,
+    )
+    for ballots, errors in chunks:
+        if chunk_errors is not None:
+            chunk_errors.append(errors)
+        yield from ballots
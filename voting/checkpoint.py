@@ -0,0 +1,92 @@
+"""
+Checkpointed incremental tally.
+
+Votes (and envelope VoteBatches) are processed in ObjectId order, one batch at a time. After each
+batch the merged partial counts and the id of the last processed vote are
+saved to a TallyCheckpoint, so a crashed run resumes where it stopped and a
+repeated run only decrypts ballots that arrived since the previous one.
+"""
+from datetime import timedelta
+from bson import ObjectId
+from django.conf import settings
+from django.utils import timezone
+from .decryption import decryption_pool, iter_decrypted_chunks
+from .models import TallyCheckpoint, Vote, VoteBatch
+from .tally import count_ballots
+
+def merge_counts(stored, counts):
+    """Add a count_ballots() 'counts' dict into the JSON-stored partial counts"""
+    for candidate_id, ranks in counts.items():
+        row = stored.setdefault(candidate_id, {})
+        for rank, count in ranks.items():
+            row[str(rank)] = row.get(str(rank), 0) + count
+    return stored
+
+def pending_votes(checkpoint, model=Vote, watermark='last_vote_id'):
+    """
+    Rows of `model` newer than the checkpoint's `watermark` field, in id order:
+    (id, token) for votes, (id, envelope, offsets) for vote batches.
+
+    ObjectIds are generated by each client from its own clock, so ids from the
+    last TALLY_CHECKPOINT_LAG_SECONDS are held back until every writer's ids
+    have moved past them; otherwise a late insert could land behind the watermark.
+    """
+    cutoff = ObjectId.from_datetime(timezone.now() - timedelta(seconds=settings.TALLY_CHECKPOINT_LAG_SECONDS))
+    rows = model.objects.filter(id__lt=cutoff)
+    if getattr(checkpoint, watermark):
+        rows = rows.filter(id__gt=ObjectId(getattr(checkpoint, watermark)))
+    fields = ('envelope', 'offsets') if model is VoteBatch else ('preferences',)
+    return rows.order_by('id').values_list('id', *fields)
+
+def run_incremental_tally(name='default', batch_size=None, workers=None, progress=None):
+    """
+    Bring the checkpoint called `name` up to date and return it.
+
+    `progress`, if given, is called with the checkpoint after every saved batch.
+    """
+    batch_size = batch_size or settings.TALLY_CHECKPOINT_BATCH_SIZE
+    workers = workers or settings.VOTE_DECRYPT_WORKERS
+    checkpoint, _ = TallyCheckpoint.objects.get_or_create(name=name)
+    # Split each batch evenly across the workers
+    chunk_size = max(1, -(-batch_size // workers))
+
+    # Per-ballot votes, then group-committed envelopes (each holding up to a commit batch of ballots)
+    sources = (
+        (Vote, 'last_vote_id', batch_size),
+        (VoteBatch, 'last_batch_id', max(1, batch_size // settings.VOTING_GROUP_COMMIT_MAX_BATCH)),
+    )
+
+    pool = decryption_pool(settings.ENCRYPTION_KEYS, workers) if workers > 1 else None
+    try:
+        for model, watermark, rows_per_batch in sources:
+            _advance(checkpoint, model, watermark, rows_per_batch, workers, chunk_size, pool, progress)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return checkpoint
+
+def _advance(checkpoint, model, watermark, rows_per_batch, workers, chunk_size, pool, progress):
+    while True:
+        rows = list(pending_votes(checkpoint, model, watermark)[:rows_per_batch])
+        if not rows:
+            break
+
+        ballots = []
+        skipped = 0
+        chunks = iter_decrypted_chunks(
+            # A token, or an (envelope, offsets) pair
+            (row[1] if len(row) == 2 else row[1:] for row in rows), settings.ENCRYPTION_KEYS,
+            workers=workers, chunk_size=chunk_size, pool=pool,
+        )
+        for chunk_ballots, errors in chunks:
+            ballots.extend(chunk_ballots)
+            skipped += errors
+
+        tally = count_ballots(ballots)
+        merge_counts(checkpoint.counts, tally['counts'])
+        checkpoint.ballots += tally['ballots']
+        checkpoint.skipped += skipped
+        setattr(checkpoint, watermark, str(rows[-1][0]))
+        checkpoint.save()
+        if progress:
+            progress(checkpoint)
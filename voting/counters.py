@@ -0,0 +1,188 @@
+"""
+Materialized per-candidate, per-rank tally.
+
+submit_vote bumps one counter per preference as each ballot is accepted, so
+the results page only has to read C x 3 rows instead of decrypting every
+ballot. Counters are kept nationally and for the ballot's electoral district
+and polling division (see region_keys), so regional results cost the same.
+rebuild_counters() reconciles the counters against the encrypted
+vote collection (see `manage.py rebuild_tally`); submissions must be paused
+while it runs.
+"""
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models import F
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .ballots import stream_ballots
+from .decryption import decryption_pool
+from .models import TallyCounter, TallyWatermark, Vote, VoteBatch
+from .tally import count_ballots, empty_counts
+
+WATERMARK = 'results'
+DUPLICATE_KEY = 11000
+# Prefix of the counter rows a rebuild writes before swapping them in
+STAGING = 'rebuild:'
+
+
+class TallyChanged(Exception):
+    """Ballots were counted while the counters were being rebuilt"""
+
+def region_keys(electoral_district=None, polling_division=None):
+    """Counter regions a ballot cast at this location contributes to; '' is national"""
+    keys = ['']
+    if electoral_district:
+        keys.append(f"district:{electoral_district}")
+    if polling_division:
+        keys.append(f"division:{electoral_district or ''}/{polling_division}")
+    return keys
+
+def advance_watermark(ballots=1):
+    """Bump the results version so cached pages and ETags are invalidated"""
+    _upsert(TallyWatermark, [UpdateOne({'name': WATERMARK}, {'$inc': {'version': 1, 'ballots': ballots}}, upsert=True)])
+
+def read_watermark():
+    """Return the current results version (0 before the first ballot)"""
+    version = TallyWatermark.objects.filter(name=WATERMARK).values_list('version', flat=True).first()
+    return version or 0
+
+def record_ballot(preferences, electoral_district=None, polling_division=None):
+    """Add one accepted ballot ({'1': id, '2': id, '3': id}) to the counters"""
+    record_ballots([(preferences, electoral_district, polling_division)])
+
+def record_ballots(ballots):
+    """
+    Add a batch of accepted ballots, given as (preferences, electoral_district,
+    polling_division) tuples. Increments are summed first, so each counter
+    is written once per batch however many ballots touch it, and all of them
+    go in one bulk write of $inc upserts.
+    """
+    amounts = {}
+    for preferences, electoral_district, polling_division in ballots:
+        for region in region_keys(electoral_district, polling_division):
+            for rank, candidate_id in preferences.items():
+                if candidate_id:
+                    key = (region, str(candidate_id), int(rank))
+                    amounts[key] = amounts.get(key, 0) + 1
+    if amounts:
+        _upsert(TallyCounter, [
+            UpdateOne({'region': region, 'candidate_id': candidate_id, 'rank': rank}, {'$inc': {'count': amount}}, upsert=True)
+            for (region, candidate_id, rank), amount in amounts.items()
+        ])
+    advance_watermark(len(ballots))
+
+def _upsert(model, operations):
+    """Apply upserting UpdateOne operations to the model's collection in one round trip"""
+    collection = connection.get_collection(model._meta.db_table)
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors') or []
+        if not errors or any(error.get('code') != DUPLICATE_KEY for error in errors):
+            raise
+        # Another request created the same counters first; they exist now, so these update them
+        collection.bulk_write([operations[error['index']] for error in errors], ordered=False)
+
+def read_counts(region=''):
+    """Return {candidate_id: {1: n, 2: n, 3: n}} from the counter rows of `region`"""
+    counts = {}
+    rows = TallyCounter.objects.filter(region=region).values_list('candidate_id', 'rank', 'count')
+    for candidate_id, rank, count in rows:
+        counts.setdefault(candidate_id, empty_counts())[rank] = count
+    return counts
+
+def write_counters(counts_by_region, ballots, expected_version=None, replace_all=False):
+    """
+    Replace the counters of every region in `counts_by_region`
+    ({region: {candidate_id: {rank: n}}}) and bump the watermark.
+
+    The new rows are written under the STAGING prefix first, so the live
+    counters are untouched until they are complete. With `expected_version`
+    they are swapped in only if the watermark has not moved since, i.e. no
+    ballot was counted meanwhile; otherwise they are dropped and TallyChanged
+    is raised. `replace_all` also drops the regions missing from the map.
+    """
+    staged = TallyCounter.objects.filter(region__startswith=STAGING)
+    # Leftovers of an interrupted rebuild
+    staged.delete()
+    TallyCounter.objects.bulk_create(
+        TallyCounter(region=STAGING + region, candidate_id=candidate_id, rank=rank, count=count)
+        for region, counts in counts_by_region.items()
+        for candidate_id, ranks in counts.items()
+        for rank, count in ranks.items()
+        if count
+    )
+    if not _claim_watermark(ballots, expected_version):
+        staged.delete()
+        raise TallyChanged("Ballots were counted during the rebuild; pause submissions and run it again")
+    live = TallyCounter.objects.exclude(region__startswith=STAGING)
+    if not replace_all:
+        live = live.filter(region__in=list(counts_by_region))
+    live.delete()
+    for region in counts_by_region:
+        TallyCounter.objects.filter(region=STAGING + region).update(region=region)
+    # Invalidate any results page cached from the counters mid-swap
+    TallyWatermark.objects.filter(name=WATERMARK).update(version=F('version') + 1)
+
+def _claim_watermark(ballots, expected_version=None):
+    """Advance the watermark to a rebuilt total; False if it is no longer at `expected_version`"""
+    rows = TallyWatermark.objects.filter(name=WATERMARK)
+    if expected_version is not None:
+        rows = rows.filter(version=expected_version)
+    if rows.update(version=F('version') + 1, ballots=ballots):
+        return True
+    if expected_version:
+        return False
+    try:
+        TallyWatermark.objects.create(name=WATERMARK, version=1, ballots=ballots)
+    except IntegrityError:
+        # The first ballot was counted meanwhile
+        return False
+    return True
+
+def rebuild_counters(workers=None):
+    """
+    Recount every stored ballot and overwrite the counters of every region.
+
+    Each polling location is counted separately and rolled up into its
+    district and the national total. Submissions must be paused: if a ballot
+    is counted while this runs, the live counters are left as they were and
+    TallyChanged is raised. Returns (ballots_counted, chunk_errors) where
+    chunk_errors lists the undecryptable votes skipped in each decryption
+    chunk.
+    """
+    chunk_errors = []
+    counts_by_region = {}
+    total = 0
+    workers = workers or settings.VOTE_DECRYPT_WORKERS
+    version = read_watermark()
+    locations = set(Vote.objects.values_list('electoral_district', 'polling_division').distinct())
+    locations.update(VoteBatch.objects.values_list('electoral_district', 'polling_division').distinct())
+
+    # One pool shared by every location instead of one per stream
+    pool = decryption_pool(settings.ENCRYPTION_KEYS, workers) if workers > 1 else None
+    try:
+        for electoral_district, polling_division in locations:
+            tally = count_ballots(stream_ballots(
+                workers=workers,
+                chunk_errors=chunk_errors,
+                pool=pool,
+                electoral_district=electoral_district,
+                polling_division=polling_division,
+            ))
+            total += tally['ballots']
+            for region in region_keys(electoral_district, polling_division):
+                _merge_counts(counts_by_region.setdefault(region, {}), tally['counts'])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    counts_by_region.setdefault('', {})
+    write_counters(counts_by_region, total, expected_version=version, replace_all=True)
+    return total, chunk_errors
+
+def _merge_counts(target, counts):
+    for candidate_id, ranks in counts.items():
+        row = target.setdefault(candidate_id, empty_counts())
+        for rank, count in ranks.items():
+            row[rank] += count
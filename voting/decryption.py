@@ -0,0 +1,151 @@
+"""
+Bulk ballot decryption across a process pool.
+
+Items are either a per-ballot Fernet token (str) or a batch envelope, a
+(token, offsets) pair whose plaintext is several JSON ballots back to back;
+offsets[i] is where ballot i ends. An envelope costs one decryption however
+many ballots it holds.
+
+Kept free of Django imports so worker processes (spawned on Windows/macOS)
+can import it without configuring settings or the app registry.
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet
+
+_worker_cipher = None
+
+def make_cipher(keys):
+    """
+    MultiFernet over `keys`, newest first: encrypts with the first key and
+    decrypts tokens made with any of them (see ENCRYPTION_KEYS).
+    """
+    if isinstance(keys, str):
+        keys = [keys]
+    return MultiFernet([Fernet(key.encode()) for key in keys])
+
+def _init_worker(keys):
+    global _worker_cipher
+    _worker_cipher = make_cipher(keys)
+
+def seal_envelope(cipher, ballots):
+    """Encrypt a list of preference dicts as one envelope. Returns (token, offsets)."""
+    parts = [json.dumps(prefs).encode() for prefs in ballots]
+    offsets = []
+    end = 0
+    for part in parts:
+        end += len(part)
+        offsets.append(end)
+    return cipher.encrypt(b''.join(parts)).decode(), offsets
+
+def open_envelope(cipher, token, offsets):
+    """Decrypt an envelope once and split it back into its preference dicts"""
+    payload = cipher.decrypt(token.encode())
+    ballots = []
+    start = 0
+    for end in offsets:
+        ballots.append(json.loads(payload[start:end]))
+        start = end
+    return ballots
+
+def weight(item):
+    """
+    Number of ballots in a token or (token, offsets) envelope. Anything else,
+    e.g. a plaintext dict or None left by the kiosk, counts as one.
+    """
+    return len(item[1]) if isinstance(item, (tuple, list)) else 1
+
+def decrypt_chunk(items, cipher=None):
+    """Decrypt and JSON-decode a list of tokens/envelopes. Returns (ballots, error_count)."""
+    cipher = cipher or _worker_cipher
+    ballots = []
+    errors = 0
+    for item in items:
+        try:
+            if isinstance(item, (tuple, list)):
+                ballots.extend(open_envelope(cipher, *item))
+            else:
+                ballots.append(json.loads(cipher.decrypt(item.encode())))
+        except Exception:
+            # Skip invalid/unencrypted votes (e.g. from before encryption was added)
+            errors += weight(item)
+    return ballots, errors
+
+def chunked(items, size):
+    """Group items into chunks of about `size` ballots (envelopes count as their ballots)"""
+    chunk = []
+    ballots = 0
+    for item in items:
+        chunk.append(item)
+        ballots += weight(item)
+        if ballots >= size:
+            yield chunk
+            chunk = []
+            ballots = 0
+    if chunk:
+        yield chunk
+
+def decryption_pool(keys, workers):
+    """A process pool whose workers hold a cipher for `keys`; reusable across calls"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(keys,))
+
+def iter_decrypted_chunks(tokens, keys, workers=None, chunk_size=5000, pool=None):
+    """
+    Stream `tokens` through `workers` processes in chunks of `chunk_size`.
+
+    Yields (ballots, error_count) per chunk, in input order. At most
+    2 x workers chunks are read ahead of the consumer, so memory stays
+    bounded however many tokens the iterable produces. With workers=1
+    everything runs in-process, avoiding the pool start-up cost. Pass a
+    `pool` from decryption_pool() to reuse one across several calls.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = chunked(tokens, chunk_size)
+
+    if pool is not None:
+        yield from _iter_pool(pool, chunks, workers)
+    elif workers == 1:
+        cipher = make_cipher(keys)
+        for chunk in chunks:
+            yield decrypt_chunk(chunk, cipher)
+    else:
+        with decryption_pool(keys, workers) as pool:
+            yield from _iter_pool(pool, chunks, workers)
+
+def rotate_chunk(rows, cipher=None):
+    """
+    Re-encrypt (id, token) rows under the primary key. Works for per-ballot
+    tokens and envelopes alike. Returns (rotated_rows, error_count).
+    """
+    cipher = cipher or _worker_cipher
+    rotated = []
+    errors = 0
+    for row_id, token in rows:
+        try:
+            rotated.append((row_id, cipher.rotate(token.encode()).decode()))
+        except Exception:
+            errors += 1
+    return rotated, errors
+
+def encrypt_chunk(items, cipher=None):
+    """
+    Encrypt preference dicts under the primary key. A list of dicts is sealed
+    as one envelope, giving (token, offsets). Returns the encrypted items in order.
+    """
+    cipher = cipher or _worker_cipher
+    return [
+        cipher.encrypt(json.dumps(item).encode()).decode() if isinstance(item, dict)
+        else seal_envelope(cipher, item)
+        for item in items
+    ]
+
+def _iter_pool(pool, chunks, workers):
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(decrypt_chunk, chunk))
+        if len(pending) >= workers * 2:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
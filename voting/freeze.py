@@ -0,0 +1,97 @@
+"""
+Frozen copy of the ballot and success pages (manage.py freeze_election).
+
+Once nominations close the ballot only changes if a candidate is edited,
+so the pages can be rendered once and served by a static file server.
+Pages are written to VOTING_FROZEN_ROOT under the same paths as their
+URLs (voting/index.html for /voting/), each with .gz and, when the brotli
+package is installed, .br siblings for gzip_static/brotli_static. Candidate
+photos (their ballot thumbnails once generated) and party symbols are
+copied to voting/assets/ under content-hashed names, so they can be cached
+as immutable. The frozen ballot fetches its CSRF cookie from /voting/csrf/,
+the only Django request before submitting.
+"""
+import gzip
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.html import escape
+from django.utils.text import slugify
+from candidates.models import get_party_symbol
+from .views import ballot_candidates
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ASSETS_URL = '/voting/assets/'
+
+def hashed_name(source):
+    """File name with a content hash, e.g. 'sjb.3f2a9c1e04b7.png'"""
+    digest = hashlib.sha256(source.read_bytes()).hexdigest()[:12]
+    return f"{slugify(source.stem) or 'asset'}.{digest}{source.suffix.lower()}"
+
+def write_compressed(path, content):
+    """Write `content` (bytes) plus precompressed siblings; returns the paths written"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    written = [path]
+    # mtime=0 keeps the .gz byte-identical across freezes of the same page
+    gz_path = path.with_name(path.name + '.gz')
+    gz_path.write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+    written.append(gz_path)
+    if brotli is not None:
+        br_path = path.with_name(path.name + '.br')
+        br_path.write_bytes(brotli.compress(content, quality=11))
+        written.append(br_path)
+    return written
+
+def ballot_assets(candidates):
+    """{media URL used by the ballot: source file} for photos and party symbols"""
+    assets = {}
+    for candidate in candidates:
+        if candidate.thumbnails:
+            storage = candidate.candidate_photo.storage
+            for name in candidate.photo_thumbnails['ballot'].values():
+                assets[storage.url(name)] = Path(storage.path(name))
+        elif candidate.candidate_photo:
+            assets[candidate.candidate_photo.url] = Path(candidate.candidate_photo.path)
+        if candidate.party_symbol_url:
+            symbol = get_party_symbol(candidate.party_name)
+            assets[candidate.party_symbol_url] = Path(settings.MEDIA_ROOT) / 'party_symbols' / symbol
+    return assets
+
+def freeze_election(output=None):
+    """
+    Render the ballot and success pages into `output` (default
+    VOTING_FROZEN_ROOT). Returns (manifest, missing): the {original URL:
+    hashed URL} map of copied assets, and URLs whose file was not found
+    (those keep pointing at MEDIA_URL).
+    """
+    output = Path(output or settings.VOTING_FROZEN_ROOT)
+    assets_dir = output / ASSETS_URL.strip('/')
+    assets_dir.mkdir(parents=True, exist_ok=True)
+
+    candidates = ballot_candidates()
+    manifest = {}
+    missing = []
+    for url, source in ballot_assets(candidates).items():
+        if not source.is_file():
+            missing.append(url)
+            continue
+        name = hashed_name(source)
+        shutil.copyfile(source, assets_dir / name)
+        manifest[url] = ASSETS_URL + name
+
+    ballot = render_to_string('voting/index.html', {'candidates': candidates, 'frozen': True})
+    for url, hashed_url in manifest.items():
+        ballot = ballot.replace(escape(url), hashed_url)
+
+    write_compressed(output / 'voting' / 'index.html', ballot.encode())
+    write_compressed(output / 'voting' / 'success' / 'index.html', render_to_string('voting/success.html').encode())
+    (output / 'voting' / 'manifest.json').write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest, missing
@@ -0,0 +1,230 @@
+"""
+Group commit for vote inserts.
+
+Concurrent submit_vote requests hand their encrypted ballot to one
+background writer thread, which gathers ballots for up to
+VOTING_GROUP_COMMIT_MAX_WAIT_MS (or VOTING_GROUP_COMMIT_MAX_BATCH ballots)
+and stores them with a single bulk insert plus one bulk write of counter
+increments. Each request waits on a future that resolves only once its
+batch has been acknowledged by MongoDB, so a success response still means
+the ballot is stored.
+
+With VOTE_STORAGE_MODE = 'envelope' each batch is instead sealed as one
+encrypted VoteBatch per polling location, so counting it later costs one
+decryption rather than one per ballot. The submission ids of its ballots
+are stored in the same document.
+
+Retries carrying an already stored submission id (see idempotency) are
+dropped from the batch and their futures resolve to False instead of True.
+Votes are inserted unordered, so one failing document (say a retry that
+raced its original in another process) only fails its own request.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from pymongo.errors import BulkWriteError
+from election_portal.workers import QueueWorker
+from .ballots import ENVELOPE, seal_ballots
+from .counters import DUPLICATE_KEY, record_ballots
+from .models import Vote, VoteBatch
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitter(QueueWorker):
+    thread_name = 'vote-group-commit'
+
+    def __init__(self, max_batch, max_wait):
+        super().__init__()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+    def submit(self, vote, preferences):
+        """
+        Queue an unsaved Vote and its plaintext preferences (for the tally and,
+        in envelope mode, for sealing); returns a Future.
+        """
+        future = Future()
+        self.put((vote, preferences, future))
+        return future
+
+    def _gather(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._commit(self._gather())
+
+    def _commit(self, batch):
+        """Store a gathered batch and resolve every one of its futures"""
+        try:
+            close_old_connections()
+            stored = self._new_ballots(batch)
+            if settings.VOTE_STORAGE_MODE == ENVELOPE:
+                failed = self._store_envelopes(stored)
+            else:
+                failed = insert_unordered(Vote, [vote for vote, _, _ in stored])
+            for index, error in failed.items():
+                future = stored[index][2]
+                if error.get('code') == DUPLICATE_KEY:
+                    # A retry whose original was stored by another process meanwhile
+                    future.set_result(False)
+                else:
+                    future.set_exception(DatabaseError(error.get('errmsg', 'Vote insert failed')))
+            stored = [item for index, item in enumerate(stored) if index not in failed]
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        try:
+            record_ballots([
+                (preferences, vote.electoral_district, vote.polling_division)
+                for vote, preferences, _ in stored
+            ])
+        except Exception:
+            # The ballots are stored; rebuild_tally will reconcile the counters
+            logger.exception("Error updating tally for a batch of %d votes", len(stored))
+        for _, _, future in stored:
+            future.set_result(True)
+        # Retries dropped by _new_ballots
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(False)
+
+    def _new_ballots(self, batch):
+        """
+        Drop retries of ballots that are already stored (or queued earlier in
+        this batch), with one query per ballot format for the batch's ids.
+        """
+        submission_ids = {vote.submission_id for vote, _, _ in batch if vote.submission_id}
+        if not submission_ids:
+            return batch
+        seen = stored_submission_ids(submission_ids)
+        stored = []
+        for item in batch:
+            submission_id = item[0].submission_id
+            if submission_id:
+                if submission_id in seen:
+                    continue
+                seen.add(submission_id)
+            stored.append(item)
+        return stored
+
+    def _store_envelopes(self, batch):
+        """
+        Seal the batch as one VoteBatch per polling location, each carrying the
+        submission ids of its ballots, so a ballot and its id are stored
+        together or not at all. Returns {index in batch: write error} for the
+        ballots not stored, like insert_unordered.
+        """
+        failed = {}
+        by_location = {}
+        for index, (vote, _, _) in enumerate(batch):
+            by_location.setdefault((vote.electoral_district, vote.polling_division), []).append(index)
+        groups = list(by_location.values())
+        while groups:
+            errors = insert_unordered(VoteBatch, [self._seal([batch[i] for i in group]) for group in groups])
+            retry = []
+            for position, error in errors.items():
+                group = groups[position]
+                if error.get('code') != DUPLICATE_KEY:
+                    failed.update(dict.fromkeys(group, error))
+                    continue
+                # Another process stored one of these ids meanwhile: answer those
+                # as duplicates and seal the rest of the envelope again
+                taken = stored_submission_ids({batch[i][0].submission_id for i in group} - {None})
+                if not taken:
+                    # The clashing id can't be found: fail the envelope, its kiosks retry
+                    failed.update(dict.fromkeys(group, {'errmsg': error.get('errmsg', 'Duplicate submission id')}))
+                    continue
+                for i in group:
+                    if batch[i][0].submission_id in taken:
+                        failed[i] = error
+                rest = [i for i in group if batch[i][0].submission_id not in taken]
+                if rest:
+                    retry.append(rest)
+            groups = retry
+        return failed
+
+    def _seal(self, items):
+        """One VoteBatch for queued ballots from the same polling location"""
+        first = items[0][0]
+        envelope, offsets = seal_ballots([preferences for _, preferences, _ in items])
+        submission_ids = [vote.submission_id for vote, _, _ in items if vote.submission_id]
+        return VoteBatch(
+            envelope=envelope,
+            offsets=offsets,
+            electoral_district=first.electoral_district,
+            polling_division=first.polling_division,
+            # None rather than [], which a unique multikey index would treat as a value
+            submission_ids=submission_ids or None,
+        )
+
+
+def stored_submission_ids(submission_ids):
+    """Those of `submission_ids` already stored, as a Vote or sealed in a VoteBatch"""
+    submission_ids = list(submission_ids)
+    seen = set(Vote.objects.filter(submission_id__in=submission_ids).values_list('submission_id', flat=True))
+    for batch_ids in VoteBatch.objects.filter(submission_ids__overlap=submission_ids).values_list(
+        'submission_ids', flat=True
+    ):
+        seen.update(batch_ids)
+    return seen & set(submission_ids)
+
+
+def insert_unordered(model, objs):
+    """
+    Insert unsaved instances of `model` with one unordered insert_many, so a
+    document that fails doesn't stop the ones after it (bulk_create inserts
+    in order and stops at the first error). Returns {index: write error} for
+    the documents that were not stored.
+    """
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    docs = [
+        {field.column: field.get_db_prep_save(field.pre_save(obj, True), connection=connection) for field in fields}
+        for obj in objs
+    ]
+    if not docs:
+        return {}
+    try:
+        connection.get_collection(model._meta.db_table).insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors')
+        if not errors:
+            raise DatabaseError(str(e)) from e
+        return {error['index']: error for error in errors}
+    return {}
+
+
+_committer = None
+_committer_lock = threading.Lock()
+
+def group_commit_enabled():
+    """Envelope storage only exists for group-committed batches, so it implies group commit"""
+    return settings.VOTING_GROUP_COMMIT or settings.VOTE_STORAGE_MODE == ENVELOPE
+
+def get_group_committer():
+    global _committer
+    if _committer is None:
+        with _committer_lock:
+            if _committer is None:
+                _committer = GroupCommitter(
+                    settings.VOTING_GROUP_COMMIT_MAX_BATCH,
+                    settings.VOTING_GROUP_COMMIT_MAX_WAIT_MS / 1000,
+                )
+    return _committer
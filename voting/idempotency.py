@@ -0,0 +1,47 @@
+"""
+Idempotent vote submission.
+
+Clients send a random submission id with each ballot (JSON 'submission_id'
+or an Idempotency-Key header) and reuse it when they retry. The id is stored
+in the unique Vote.submission_id field (for sealed batches, the unique
+VoteBatch.submission_ids array of the same document as the ballot), so the
+insert itself detects a duplicate, and a bounded in-process cache of
+recently accepted ids answers most retries without touching MongoDB at all.
+A duplicate gets the same success response as the original submission.
+"""
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+MAX_SUBMISSION_ID_LENGTH = 64
+
+
+class RecentSubmissions:
+    """Thread-safe LRU set of recently accepted submission ids"""
+
+    def __init__(self, size):
+        self.size = size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, submission_id):
+        with self._lock:
+            if submission_id in self._ids:
+                self._ids.move_to_end(submission_id)
+                return True
+            return False
+
+    def add(self, submission_id):
+        with self._lock:
+            self._ids[submission_id] = None
+            self._ids.move_to_end(submission_id)
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+
+
+recent_submissions = RecentSubmissions(settings.VOTING_IDEMPOTENCY_CACHE_SIZE)
+
+def submission_id_from(request, data):
+    """The client's idempotency key, or None for clients that don't send one"""
+    submission_id = data.get('submission_id') or request.headers.get('Idempotency-Key')
+    return str(submission_id) if submission_id else None
@@ -0,0 +1,93 @@
+"""
+Live results push over server-sent events.
+
+One ResultsBroadcaster per process polls the tally watermark every
+RESULTS_STREAM_TICK_SECONDS and, only when it has moved, rebuilds the result
+rows once. Every connected viewer waits on the same condition and sends its
+client just the rows that changed since its last event, so thousands of
+viewers share one computation per tick and bursts of ballots are coalesced
+into a single update. Needs an ASGI server (see election_portal/asgi.py), so
+it is only offered with VOTING_LIVE_RESULTS.
+"""
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .counters import read_watermark
+
+
+class ResultsBroadcaster:
+    def __init__(self):
+        self.version = None
+        self.rows = []
+        self.subscribers = 0
+        self._condition = None
+        self._task = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._condition = asyncio.Condition()
+            self._task = loop.create_task(self._poll())
+
+    async def _poll(self):
+        # Imported here: views imports this module for the stream endpoint
+        from .views import results_rows
+        while self.subscribers:
+            version = await sync_to_async(read_watermark)()
+            if version != self.version:
+                rows = await sync_to_async(results_rows)(version)
+                async with self._condition:
+                    self.version, self.rows = version, rows
+                    self._condition.notify_all()
+            await asyncio.sleep(settings.RESULTS_STREAM_TICK_SECONDS)
+
+    async def updates(self):
+        """Yield (version, rows) whenever the tally changes, or None as a keep-alive"""
+        self.subscribers += 1
+        self._ensure_running()
+        seen = None
+        try:
+            while True:
+                timed_out = False
+                async with self._condition:
+                    try:
+                        await asyncio.wait_for(
+                            self._condition.wait_for(lambda: self.version is not None and self.version != seen),
+                            timeout=settings.RESULTS_STREAM_HEARTBEAT_SECONDS,
+                        )
+                    except asyncio.TimeoutError:
+                        timed_out = True
+                    else:
+                        seen = self.version
+                        rows = self.rows
+                # Yield only after releasing the lock: a slow client must not block the others
+                if timed_out:
+                    yield None
+                else:
+                    yield seen, rows
+        finally:
+            self.subscribers -= 1
+
+
+broadcaster = ResultsBroadcaster()
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+async def results_events():
+    """SSE frames: a full 'snapshot' first, then 'delta' events with only the changed rows"""
+    sent = {}
+    async for update in broadcaster.updates():
+        if update is None:
+            yield ": keep-alive\n\n"
+            continue
+        version, rows = update
+        current = {row['id']: row['counts'] for row in rows}
+        if not sent:
+            yield sse_event('snapshot', {'version': version, 'results': rows})
+        else:
+            changes = {c_id: counts for c_id, counts in current.items() if sent.get(c_id) != counts}
+            if changes:
+                yield sse_event('delta', {'version': version, 'changes': changes})
+        sent = current
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from candidates.models import Candidate
+from voting.ballots import stream_ballots
+from voting.contingent import contingent_count, encode_ballots
+from voting.snapshot import load_snapshot
+
+
+class Command(BaseCommand):
+    help = "Run the presidential contingent count (2nd/3rd preference redistribution)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Decryption processes (default: VOTE_DECRYPT_WORKERS)")
+        parser.add_argument('--snapshot', help="Count from a snapshot_ballots file instead of the vote collection")
+
+    def handle(self, *args, **options):
+        names = {
+            str(c_id): ballot_name or full_name
+            for c_id, ballot_name, full_name in Candidate.objects.values_list('id', 'ballot_name', 'full_name')
+        }
+        if options['snapshot']:
+            matrix, candidate_ids = load_snapshot(options['snapshot'])
+            for c_id in candidate_ids:
+                names.setdefault(c_id, c_id)
+        else:
+            candidate_ids = list(names)
+            matrix = encode_ballots(stream_ballots(workers=options['workers']), candidate_ids)
+        result = contingent_count(matrix, candidate_ids)
+
+        self.stdout.write(f"Valid ballots: {result['valid_ballots']}")
+        for c_id, votes in sorted(result['first_preferences'].items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  {names[c_id]}: {votes}")
+        if result['contingent']:
+            self.stdout.write("No candidate has an absolute majority; contingent count:")
+            for c_id in result['finalists']:
+                self.stdout.write(
+                    f"  {names[c_id]}: {result['first_preferences'][c_id]} + "
+                    f"{result['transfers'][c_id]} = {result['final'][c_id]}"
+                )
+        if result['tie']:
+            tied = ', '.join(names[c_id] for c_id in result['tie'])
+            stage = "final count" if result['finalists'] else "a place in the contingent count"
+            self.stdout.write(self.style.WARNING(f"Tie for {stage}: {tied}; no candidate elected"))
+        if result['elected']:
+            self.stdout.write(self.style.SUCCESS(f"Elected: {names[result['elected']]}"))
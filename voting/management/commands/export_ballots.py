@@ -0,0 +1,24 @@
+import json
+from django.core.management.base import BaseCommand
+from voting.ballots import stream_ballots
+
+
+class Command(BaseCommand):
+    help = "Export decrypted ballots as JSON lines, streaming in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', help="Output file (default: stdout)")
+        parser.add_argument('--workers', type=int, help="Decryption processes (default: VOTE_DECRYPT_WORKERS)")
+
+    def handle(self, *args, **options):
+        chunk_errors = []
+        out = open(options['output'], 'w') if options['output'] else self.stdout
+        exported = 0
+        try:
+            for prefs in stream_ballots(workers=options['workers'], chunk_errors=chunk_errors):
+                out.write(json.dumps(prefs) + '\n')
+                exported += 1
+        finally:
+            if options['output']:
+                out.close()
+        self.stderr.write(f"Exported {exported} ballots ({sum(chunk_errors)} skipped)")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from voting.freeze import brotli, freeze_election
+
+
+class Command(BaseCommand):
+    help = "Pre-render the ballot and success pages into precompressed static files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Directory to write to (default: VOTING_FROZEN_ROOT)")
+
+    def handle(self, *args, **options):
+        manifest, missing = freeze_election(options['output'])
+        for url in missing:
+            self.stdout.write(self.style.WARNING(f"Missing media file for {url}; left pointing at MEDIA_URL"))
+        if brotli is None:
+            self.stdout.write(self.style.WARNING("brotli is not installed; wrote gzip copies only"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Froze /voting/ and /voting/success/ with {len(manifest)} hashed assets. "
+            "Re-run after any candidate change."
+        ))
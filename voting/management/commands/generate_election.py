@@ -0,0 +1,87 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from candidates.models import Candidate
+from voting.ballots import ENVELOPE
+from voting.synthetic import generate_election, popularity, synthetic_candidates
+from voting.views import invalidate_ballot_page
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate synthetic candidates and encrypted ballots for performance testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=20, help="Candidates to create; 0 votes for the existing ones (default: 20)")
+        parser.add_argument('--ballots', type=int, default=100000, help="Ballots to generate (default: 100000)")
+        parser.add_argument('--distribution', choices=['uniform', 'zipf'], default='zipf', help="Candidate popularity (default: zipf)")
+        parser.add_argument('--skew', type=float, default=1.0, help="Zipf exponent; higher concentrates votes on fewer candidates (default: 1.0)")
+        parser.add_argument('--marks', default='0.3,0.3,0.4', help="Shares of ballots marking 1, 2 and 3 preferences (default: 0.3,0.3,0.4)")
+        parser.add_argument('--location', action='append', dest='locations', metavar='DISTRICT/DIVISION',
+                            help="Polling location to spread ballots over; repeatable (default: the configured location)")
+        parser.add_argument('--batch-size', type=int, help="Ballots per encrypted and inserted batch (default: VOTE_DECRYPT_CHUNK_SIZE)")
+        parser.add_argument('--workers', type=int, help="Encryption processes (default: VOTE_DECRYPT_WORKERS)")
+        parser.add_argument('--envelope-size', type=int,
+                            help="Seal ballots as envelopes of this many; 0 stores one Vote each "
+                                 "(default: VOTING_GROUP_COMMIT_MAX_BATCH in envelope mode, else 0)")
+        parser.add_argument('--seed', type=int, help="Random seed for reproducible ballots")
+        parser.add_argument('--confirm', action='store_true',
+                            help="Run even though DEBUG is off; only against a throwaway database")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['confirm']:
+            database = settings.DATABASES['default']['NAME']
+            raise CommandError(
+                f"DEBUG is off: refusing to add synthetic candidates, ballots and tally counts to "
+                f"'{database}'. Pass --confirm if this is a throwaway test database."
+            )
+        try:
+            marks = np.array([float(share) for share in options['marks'].split(',')])
+        except ValueError:
+            raise CommandError("--marks must be comma-separated numbers")
+        if not 1 <= len(marks) <= 3 or marks.min() < 0 or not marks.sum():
+            raise CommandError("--marks takes one to three non-negative shares")
+        marks = marks / marks.sum()
+
+        locations = None
+        if options['locations']:
+            locations = [tuple(location.split('/', 1)) if '/' in location else (location, None)
+                         for location in options['locations']]
+
+        envelope_size = options['envelope_size']
+        if envelope_size is None:
+            envelope_size = settings.VOTING_GROUP_COMMIT_MAX_BATCH if settings.VOTE_STORAGE_MODE == ENVELOPE else 0
+
+        rng = np.random.default_rng(options['seed'])
+        if options['candidates']:
+            candidates = Candidate.objects.bulk_create(synthetic_candidates(options['candidates'], rng))
+            # bulk_create sends no post_save, so refresh the cached ballot page here
+            invalidate_ballot_page()
+            self.stdout.write(f"Created {len(candidates)} candidates")
+            candidate_ids = [str(c.pk) for c in candidates]
+        else:
+            candidate_ids = [str(pk) for pk in Candidate.objects.values_list('id', flat=True)]
+        if not candidate_ids:
+            raise CommandError("No candidates to vote for; pass --candidates")
+
+        last_report = [0.0]
+
+        def progress(stored, elapsed):
+            if elapsed - last_report[0] >= 2 or stored == options['ballots']:
+                last_report[0] = elapsed
+                self.stdout.write(f"  {stored} ballots, {stored / elapsed if elapsed else 0:.0f}/s")
+
+        metrics = generate_election(
+            options['ballots'],
+            candidate_ids,
+            popularity(len(candidate_ids), options['distribution'], options['skew']),
+            marks,
+            locations=locations,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            envelope_size=envelope_size,
+            seed=None if options['seed'] is None else options['seed'] + 1,
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {metrics['ballots']} ballots in {metrics['elapsed']:.1f}s ({metrics['rate']:.0f}/s)"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from voting.checkpoint import run_incremental_tally
+from voting.models import TallyCheckpoint
+
+
+class Command(BaseCommand):
+    help = "Tally ballots newer than the stored checkpoint and merge them into its partial counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='default', help="Checkpoint to advance (default: 'default')")
+        parser.add_argument('--batch-size', type=int, help="Votes per checkpointed batch (default: TALLY_CHECKPOINT_BATCH_SIZE)")
+        parser.add_argument('--workers', type=int, help="Decryption processes (default: VOTE_DECRYPT_WORKERS)")
+        parser.add_argument('--reset', action='store_true', help="Discard the checkpoint and count from the first vote")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            TallyCheckpoint.objects.filter(name=options['name']).delete()
+
+        def progress(checkpoint):
+            self.stdout.write(
+                f"  {checkpoint.ballots} ballots (vote {checkpoint.last_vote_id or '-'}, "
+                f"batch {checkpoint.last_batch_id or '-'})"
+            )
+
+        checkpoint = run_incremental_tally(
+            name=options['name'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Checkpoint '{checkpoint.name}': {checkpoint.ballots} ballots counted, "
+            f"{checkpoint.skipped} skipped"
+        ))
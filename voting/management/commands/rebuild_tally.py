@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from voting.contingent import rank_counts
+from voting.counters import TallyChanged, rebuild_counters, write_counters
+from voting.snapshot import load_snapshot
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized results tally from the encrypted vote collection (pause submissions first)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Decryption processes (default: VOTE_DECRYPT_WORKERS)")
+        parser.add_argument('--snapshot', help="Rebuild from a snapshot_ballots file instead of the vote collection")
+
+    def handle(self, *args, **options):
+        if options['snapshot']:
+            matrix, candidate_ids = load_snapshot(options['snapshot'])
+            # Snapshots carry no polling locations, so only the national counters are replaced
+            write_counters({'': rank_counts(matrix, candidate_ids)}, matrix.shape[0])
+            self.stdout.write(self.style.SUCCESS(f"Tally rebuilt from {matrix.shape[0]} snapshot ballots"))
+            return
+
+        try:
+            total, chunk_errors = rebuild_counters(workers=options['workers'])
+        except TallyChanged as e:
+            raise CommandError(str(e))
+        for chunk, errors in enumerate(chunk_errors):
+            if errors:
+                self.stdout.write(self.style.WARNING(f"Chunk {chunk}: skipped {errors} undecryptable votes"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Tally rebuilt from {total} ballots ({sum(chunk_errors)} skipped)"
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from voting.models import TallyCheckpoint
+from voting.rotation import rotation_checkpoint_name, run_key_rotation
+
+
+class Command(BaseCommand):
+    help = "Re-encrypt every stored vote under the newest key in ENCRYPTION_KEYS (resumable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Votes per written batch (default: TALLY_CHECKPOINT_BATCH_SIZE)")
+        parser.add_argument('--workers', type=int, help="Encryption processes (default: VOTE_DECRYPT_WORKERS)")
+        parser.add_argument('--restart', action='store_true', help="Ignore saved progress and start from the first vote")
+
+    def handle(self, *args, **options):
+        if options['restart']:
+            TallyCheckpoint.objects.filter(name=rotation_checkpoint_name()).delete()
+
+        def progress(metrics):
+            self.stdout.write(
+                f"  {metrics['rotated']} rotated, {metrics['remaining']} remaining, "
+                f"{metrics['errors']} errors, {metrics['rate']:.0f}/s"
+            )
+
+        metrics = run_key_rotation(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            progress=progress,
+        )
+        style = self.style.WARNING if metrics['errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Rotation complete: {metrics['rotated']} rotated, {metrics['errors']} could not be "
+            f"decrypted with any configured key ({metrics['elapsed']:.1f}s)"
+        ))
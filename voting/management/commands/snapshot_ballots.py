@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from candidates.models import Candidate
+from voting.ballots import stream_ballots
+from voting.contingent import encode_ballots
+from voting.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write a columnar snapshot of the decrypted ballots for fast recounts and audits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Snapshot file to write")
+        parser.add_argument('--workers', type=int, help="Decryption processes (default: VOTE_DECRYPT_WORKERS)")
+
+    def handle(self, *args, **options):
+        candidate_ids = [str(c_id) for c_id in Candidate.objects.values_list('id', flat=True)]
+        chunk_errors = []
+        matrix = encode_ballots(
+            stream_ballots(workers=options['workers'], chunk_errors=chunk_errors), candidate_ids
+        )
+        write_snapshot(options['output'], matrix, candidate_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {matrix.shape[0]} ballots for {len(candidate_ids)} candidates to "
+            f"{options['output']} ({sum(chunk_errors)} skipped)"
+        ))
@@ -0,0 +1,34 @@
+import django_mongodb_backend.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TallyCounter",
+            fields=[
+                (
+                    "id",
+                    django_mongodb_backend.fields.ObjectIdAutoField(
+                        primary_key=True, serialize=False
+                    ),
+                ),
+                ("candidate_id", models.CharField(max_length=24)),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("count", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "vote_tally",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("candidate_id", "rank"), name="unique_tally_counter"
+                    )
+                ],
+            },
+        ),
+    ]
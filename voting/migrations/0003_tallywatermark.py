@@ -0,0 +1,29 @@
+import django_mongodb_backend.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0002_tallycounter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TallyWatermark",
+            fields=[
+                (
+                    "id",
+                    django_mongodb_backend.fields.ObjectIdAutoField(
+                        primary_key=True, serialize=False
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("version", models.BigIntegerField(default=0)),
+                ("ballots", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "vote_tally_watermark",
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django_mongodb_backend.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0003_tallywatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TallyCheckpoint",
+            fields=[
+                (
+                    "id",
+                    django_mongodb_backend.fields.ObjectIdAutoField(
+                        primary_key=True, serialize=False
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                (
+                    "last_vote_id",
+                    models.CharField(blank=True, default="", max_length=24),
+                ),
+                ("ballots", models.BigIntegerField(default=0)),
+                ("skipped", models.BigIntegerField(default=0)),
+                ("counts", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "vote_tally_checkpoint",
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0004_tallycheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="electoral_district",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="polling_division",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RemoveConstraint(
+            model_name="tallycounter",
+            name="unique_tally_counter",
+        ),
+        migrations.AddField(
+            model_name="tallycounter",
+            name="region",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name="tallycounter",
+            constraint=models.UniqueConstraint(
+                fields=("region", "candidate_id", "rank"), name="unique_tally_counter"
+            ),
+        ),
+    ]
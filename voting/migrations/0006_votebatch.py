@@ -0,0 +1,42 @@
+import django_mongodb_backend.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0005_regional_tally"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteBatch",
+            fields=[
+                (
+                    "id",
+                    django_mongodb_backend.fields.ObjectIdAutoField(
+                        primary_key=True, serialize=False
+                    ),
+                ),
+                ("envelope", models.TextField()),
+                ("offsets", models.JSONField(default=list)),
+                ("timestamp", models.DateTimeField(auto_now_add=True)),
+                (
+                    "electoral_district",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                (
+                    "polling_division",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+            ],
+            options={
+                "db_table": "vote_batch",
+            },
+        ),
+        migrations.AddField(
+            model_name="tallycheckpoint",
+            name="last_batch_id",
+            field=models.CharField(blank=True, default="", max_length=24),
+        ),
+    ]
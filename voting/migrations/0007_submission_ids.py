@@ -0,0 +1,28 @@
+import django_mongodb_backend.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0006_votebatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="submission_id",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="votebatch",
+            name="submission_ids",
+            field=django_mongodb_backend.fields.ArrayField(
+                base_field=models.CharField(max_length=64),
+                blank=True,
+                null=True,
+                size=None,
+                unique=True,
+            ),
+        ),
+    ]
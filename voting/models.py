@@ -1,10 +1,87 @@
-from django_mongodb_backend.fields import ObjectIdAutoField
+from django_mongodb_backend.fields import ArrayField, ObjectIdAutoField
 from django.db import models
 
 class Vote(models.Model):
     id = ObjectIdAutoField(primary_key=True)
     preferences = models.TextField() # Encrypted string
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Polling location the ballot was cast at (same vocabulary as Candidate)
+    electoral_district = models.CharField(max_length=100, blank=True, null=True)
+    polling_division = models.CharField(max_length=100, blank=True, null=True)
+    # Client-generated idempotency key; the unique index rejects retried submissions
+    submission_id = models.CharField(max_length=64, unique=True, blank=True, null=True)
 
     class Meta:
         db_table = 'vote'
+
+
+class VoteBatch(models.Model):
+    """
+    Ballots group-committed together and sealed as one encrypted envelope
+    (VOTE_STORAGE_MODE = 'envelope'); see voting.decryption.seal_envelope.
+    """
+    id = ObjectIdAutoField(primary_key=True)
+    envelope = models.TextField() # Encrypted, concatenated JSON ballots
+    offsets = models.JSONField(default=list) # End offset of each ballot in the decrypted envelope
+    timestamp = models.DateTimeField(auto_now_add=True)
+    electoral_district = models.CharField(max_length=100, blank=True, null=True)
+    polling_division = models.CharField(max_length=100, blank=True, null=True)
+    # Idempotency keys of the sealed ballots, written with them in one document; the unique
+    # multikey index rejects a batch holding an already stored id. None (unindexed) when there are none.
+    submission_ids = ArrayField(models.CharField(max_length=64), unique=True, blank=True, null=True)
+
+    class Meta:
+        db_table = 'vote_batch'
+
+    def __str__(self):
+        return f"Batch {self.id} ({len(self.offsets)} ballots)"
+
+
+class TallyCounter(models.Model):
+    """Materialized count of ballots in `region` giving `candidate_id` the preference `rank`."""
+    id = ObjectIdAutoField(primary_key=True)
+    region = models.CharField(max_length=255, blank=True, default='') # '' = national, see voting.counters.region_keys
+    candidate_id = models.CharField(max_length=24)
+    rank = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'vote_tally'
+        constraints = [
+            models.UniqueConstraint(fields=['region', 'candidate_id', 'rank'], name='unique_tally_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.region or 'national'} {self.candidate_id} #{self.rank}: {self.count}"
+
+
+class TallyWatermark(models.Model):
+    """Version of the materialized tally; advanced whenever the counters change."""
+    id = ObjectIdAutoField(primary_key=True)
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+    ballots = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'vote_tally_watermark'
+
+    def __str__(self):
+        return f"{self.name} v{self.version} ({self.ballots} ballots)"
+
+
+class TallyCheckpoint(models.Model):
+    """Partial counts of an incremental tally job and the last vote it processed."""
+    id = ObjectIdAutoField(primary_key=True)
+    name = models.CharField(max_length=50, unique=True)
+    last_vote_id = models.CharField(max_length=24, blank=True, default='')
+    last_batch_id = models.CharField(max_length=24, blank=True, default='')
+    ballots = models.BigIntegerField(default=0)
+    skipped = models.BigIntegerField(default=0)
+    counts = models.JSONField(default=dict) # {candidate_id: {"1": n, "2": n, "3": n}}
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'vote_tally_checkpoint'
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_vote_id or 'start'} ({self.ballots} ballots)"
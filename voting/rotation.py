@@ -0,0 +1,98 @@
+"""
+Background re-encryption of the vote collection under a new key.
+
+Deploy the new key first in ENCRYPTION_KEYS (new key first, old keys after)
+so every server writes with it and can still read the old tokens, then run
+`manage.py rotate_vote_keys`. The job streams votes and envelope batches
+in id order, re-encrypts each batch across a process pool
+(MultiFernet.rotate) and writes it back with one bulk update. Progress is
+checkpointed after every batch, so an interrupted rotation resumes where
+it stopped. Once it completes the old key can be removed.
+"""
+import hashlib
+import time
+from django.conf import settings
+from .checkpoint import pending_votes
+from .decryption import decryption_pool, make_cipher, rotate_chunk
+from .models import TallyCheckpoint, Vote, VoteBatch
+
+# (model, checkpoint watermark field, encrypted field)
+SOURCES = (
+    (Vote, 'last_vote_id', 'preferences'),
+    (VoteBatch, 'last_batch_id', 'envelope'),
+)
+
+def rotation_checkpoint_name(keys=None):
+    """Checkpoint name for rotating to the current primary key; a new key starts a fresh job"""
+    primary = (keys or settings.ENCRYPTION_KEYS)[0]
+    return f"rotation:{hashlib.sha256(primary.encode()).hexdigest()[:12]}"
+
+def run_key_rotation(batch_size=None, workers=None, progress=None):
+    """
+    Re-encrypt every stored vote and envelope under the primary key.
+
+    `progress`, if given, is called after every written batch with a dict of
+    metrics: rotated, errors, remaining (approximate), elapsed and rate
+    (rows per second). Returns the final metrics.
+    """
+    keys = settings.ENCRYPTION_KEYS
+    batch_size = batch_size or settings.TALLY_CHECKPOINT_BATCH_SIZE
+    workers = workers or settings.VOTE_DECRYPT_WORKERS
+    checkpoint, _ = TallyCheckpoint.objects.get_or_create(name=rotation_checkpoint_name(keys))
+
+    started = time.monotonic()
+    metrics = {
+        'rotated': checkpoint.ballots,
+        'errors': checkpoint.skipped,
+        'remaining': sum(pending_votes(checkpoint, model, watermark).count() for model, watermark, _ in SOURCES),
+        'elapsed': 0.0,
+        'rate': 0.0,
+    }
+    rotated_this_run = 0
+
+    pool = decryption_pool(keys, workers) if workers > 1 else None
+    cipher = make_cipher(keys)
+    try:
+        for model, watermark, field in SOURCES:
+            while True:
+                rows = [row[:2] for row in pending_votes(checkpoint, model, watermark)[:batch_size]]
+                if not rows:
+                    break
+
+                if pool is None:
+                    results = [rotate_chunk(rows, cipher)]
+                else:
+                    size = max(1, -(-len(rows) // workers))
+                    results = pool.map(rotate_chunk, [rows[i:i + size] for i in range(0, len(rows), size)])
+                rotated = []
+                errors = 0
+                for chunk_rotated, chunk_errors in results:
+                    rotated.extend(chunk_rotated)
+                    errors += chunk_errors
+
+                model.objects.bulk_update(
+                    [model(id=row_id, **{field: token}) for row_id, token in rotated],
+                    [field],
+                    batch_size=settings.VOTE_DECRYPT_CHUNK_SIZE,
+                )
+
+                checkpoint.ballots += len(rotated)
+                checkpoint.skipped += errors
+                setattr(checkpoint, watermark, str(rows[-1][0]))
+                checkpoint.save()
+
+                rotated_this_run += len(rotated)
+                elapsed = time.monotonic() - started
+                metrics.update({
+                    'rotated': checkpoint.ballots,
+                    'errors': checkpoint.skipped,
+                    'remaining': max(0, metrics['remaining'] - len(rows)),
+                    'elapsed': elapsed,
+                    'rate': rotated_this_run / elapsed if elapsed else 0.0,
+                })
+                if progress:
+                    progress(dict(metrics))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return metrics
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from candidates.models import Candidate
+from candidates.thumbnails import thumbnails_ready
+from .validation import candidate_ids
+from .views import invalidate_ballot_page
+
+
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+def invalidate_candidate_ids(sender, **kwargs):
+    candidate_ids.invalidate()
+
+
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+@receiver(thumbnails_ready, sender=Candidate)
+def invalidate_ballot(sender, **kwargs):
+    invalidate_ballot_page()
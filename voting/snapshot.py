@@ -0,0 +1,88 @@
+"""
+Columnar decrypted-ballot snapshots.
+
+Layout (little-endian):
+
+    header   64 bytes: magic, format version, dtype code, candidate count,
+             ballot count, SHA-256 of everything after the header
+    ids      candidate count x 24 bytes (ObjectId hex, NUL padded)
+    padding  up to the next 64-byte boundary
+    columns  rank 1, rank 2 and rank 3 columns, ballot count entries each,
+             holding candidate index + 1 (0 = no preference) as uint8, or
+             uint16 when there are 255 or more candidates
+
+load_snapshot() memory-maps the columns, so recounts start without reading
+or decrypting the vote collection and without copying the data.
+"""
+import hashlib
+import struct
+import numpy as np
+
+MAGIC = b'EBSNAP\x00\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHHIQ32s')
+HEADER_SIZE = 64
+ID_WIDTH = 24
+RANKS = 3
+DTYPES = {1: np.uint8, 2: np.uint16}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _columns_offset(n_candidates):
+    end = HEADER_SIZE + n_candidates * ID_WIDTH
+    return -(-end // HEADER_SIZE) * HEADER_SIZE
+
+def write_snapshot(path, matrix, candidate_ids):
+    """Write an encoded (ballots x 3) matrix (see voting.contingent) to `path`"""
+    candidate_ids = [str(c_id) for c_id in candidate_ids]
+    dtype_code = 1 if len(candidate_ids) < 255 else 2
+    columns = np.ascontiguousarray(matrix.T, dtype=DTYPES[dtype_code])
+
+    ids = b''.join(c_id.encode('ascii').ljust(ID_WIDTH, b'\x00') for c_id in candidate_ids)
+    padding = b'\x00' * (_columns_offset(len(candidate_ids)) - HEADER_SIZE - len(ids))
+
+    checksum = hashlib.sha256()
+    for part in (ids, padding, columns.data):
+        checksum.update(part)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, dtype_code, len(candidate_ids), columns.shape[1], checksum.digest()
+    ).ljust(HEADER_SIZE, b'\x00')
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(ids)
+        f.write(padding)
+        f.write(columns.data)
+
+def load_snapshot(path, verify=True):
+    """
+    Memory-map a snapshot. Returns (matrix, candidate_ids) where matrix is a
+    read-only (ballots x 3) view over the file's columns.
+    """
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    if mapped.size < HEADER_SIZE:
+        raise SnapshotError(f"{path} is too short to be a ballot snapshot")
+    magic, version, dtype_code, n_candidates, n_ballots, digest = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or dtype_code not in DTYPES:
+        raise SnapshotError(f"{path} is not a version {FORMAT_VERSION} ballot snapshot")
+
+    offset = _columns_offset(n_candidates)
+    dtype = np.dtype(DTYPES[dtype_code])
+    if mapped.size != offset + RANKS * n_ballots * dtype.itemsize:
+        raise SnapshotError(f"{path} is truncated")
+    if verify and hashlib.sha256(mapped[HEADER_SIZE:]).digest() != digest:
+        raise SnapshotError(f"{path} failed its checksum")
+
+    ids = bytes(mapped[HEADER_SIZE:HEADER_SIZE + n_candidates * ID_WIDTH])
+    candidate_ids = [
+        ids[i:i + ID_WIDTH].rstrip(b'\x00').decode('ascii')
+        for i in range(0, len(ids), ID_WIDTH)
+    ]
+    if n_ballots == 0:
+        # numpy cannot map a zero-length region
+        return np.zeros((0, RANKS), dtype=dtype), candidate_ids
+    columns = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(RANKS, n_ballots))
+    return columns.T, candidate_ids
@@ -0,0 +1,187 @@
+"""
+Synthetic election data for performance testing (manage.py generate_election).
+
+Candidates are validated with full_clean once and bulk inserted, skipping
+the per-row save() path. Ballots are drawn with NumPy in batches: distinct
+candidates per ballot are sampled by popularity with the Gumbel top-k
+trick, so a batch is a handful of array operations rather than a Python
+loop per ballot. Each batch is encrypted in a worker process (or sealed
+as envelopes) while the previous ones are being inserted, and the tally
+counters are updated once per batch.
+"""
+import time
+import uuid
+from collections import deque
+from datetime import date
+import numpy as np
+from django.conf import settings
+from candidates.models import Candidate
+from .counters import record_ballots
+from .decryption import decryption_pool, encrypt_chunk, make_cipher
+from .models import Vote, VoteBatch
+from .tally import RANK_KEYS
+
+FIRST_NAMES = (
+    'Nimal', 'Kamal', 'Sunil', 'Chandrika', 'Anura', 'Sajith', 'Dilani', 'Namal',
+    'Ruwan', 'Shiromi', 'Mahesh', 'Kumari', 'Tharindu', 'Nadeesha', 'Lalith', 'Pradeep',
+)
+SURNAMES = (
+    'Perera', 'Fernando', 'Silva', 'Jayasuriya', 'Bandara', 'Dissanayake', 'Wijesinghe',
+    'Senanayake', 'Gunawardena', 'Rathnayake', 'Herath', 'Kumarasinghe',
+)
+
+def synthetic_candidates(count, rng, electoral_district=None, polling_division=None):
+    """`count` unsaved Candidates that pass full_clean (checked without DB queries)"""
+    parties = [code for code, _ in Candidate.PARTY_CHOICES]
+    candidates = []
+    for i in range(count):
+        first, surname = rng.choice(FIRST_NAMES), rng.choice(SURNAMES)
+        independent = i % 10 == 9
+        candidate = Candidate(
+            full_name=f"{first} {surname}",
+            ballot_name=f"{first[0]}. {surname}",
+            date_of_birth=date(int(rng.integers(1950, 1990)), int(rng.integers(1, 13)), int(rng.integers(1, 29))),
+            # Clearly synthetic and unique across runs
+            nic=f"SYN{uuid.uuid4().hex[:12].upper()}",
+            gender=str(rng.choice(['MALE', 'FEMALE'])),
+            address=f"{i + 1} Temple Road, Colombo",
+            contact_number=f"07{int(rng.integers(10000000, 99999999))}",
+            email=f"candidate{i + 1}@example.com",
+            is_registered_voter=True,
+            electoral_district=electoral_district or 'Colombo',
+            polling_division=polling_division or 'Colombo Central',
+            gn_division='Synthetic',
+            registration_number=f"SYN-{i + 1}",
+            nomination_type='INDEPENDENT' if independent else 'PARTY',
+            party_name=None if independent else parties[i % len(parties)],
+            party_secretary_name=None if independent else 'Synthetic Secretary',
+            mp_status_proof='mp_proofs/synthetic.pdf' if independent else None,
+            nominator_nic=f"SYN{uuid.uuid4().hex[:12].upper()}" if independent else None,
+            candidate_photo='candidate_photos/synthetic.png',
+            form_a='form_a/synthetic.pdf',
+            asset_declaration='asset_declarations/synthetic.pdf',
+            eligibility_declaration=True,
+        )
+        candidate.full_clean(validate_unique=False, validate_constraints=False)
+        # bulk_create skips save(), which normally fills these
+        candidate.update_display_fields()
+        candidates.append(candidate)
+    return candidates
+
+def popularity(count, distribution='zipf', skew=1.0):
+    """Candidate weights: equal ('uniform') or falling off as 1/k^skew ('zipf')"""
+    if distribution == 'uniform':
+        weights = np.ones(count)
+    elif distribution == 'zipf':
+        weights = 1.0 / np.arange(1, count + 1) ** skew
+    else:
+        raise ValueError(f"Unknown distribution: {distribution}")
+    return weights / weights.sum()
+
+def generate_preferences(rng, count, weights, marks):
+    """
+    (count, 3) matrix of candidate indices, -1 where no preference is marked.
+
+    Each ballot ranks distinct candidates drawn without replacement in
+    proportion to `weights`; marks[k] is the share of ballots marking k + 1
+    preferences.
+    """
+    ranks = min(len(RANK_KEYS), len(weights))
+    # Gumbel top-k: the k largest log(weight) + Gumbel noise are a weighted sample without replacement
+    keys = np.log(weights) + rng.gumbel(size=(count, len(weights)))
+    top = np.argsort(-keys, axis=1)[:, :ranks]
+    matrix = np.full((count, len(RANK_KEYS)), -1, dtype=np.int64)
+    matrix[:, :ranks] = top
+    marked = rng.choice(np.arange(1, len(marks) + 1), size=count, p=marks)
+    matrix[np.arange(len(RANK_KEYS)) >= marked[:, None]] = -1
+    return matrix
+
+def to_preferences(matrix, candidate_ids):
+    """Preference dicts ({'1': id, ...}) from a generate_preferences matrix"""
+    ids = np.asarray([str(c_id) for c_id in candidate_ids], dtype=object)
+    columns = [ids[matrix[:, r]] for r in range(matrix.shape[1])]
+    marked = matrix >= 0
+    return [
+        {key: columns[r][i] for r, key in enumerate(RANK_KEYS) if marked[i, r]}
+        for i in range(len(matrix))
+    ]
+
+def _batches(rng, ballots, batch_size, candidate_ids, weights, marks, locations):
+    """Yield lists of (preferences, electoral_district, polling_division)"""
+    for start in range(0, ballots, batch_size):
+        count = min(batch_size, ballots - start)
+        preferences = to_preferences(generate_preferences(rng, count, weights, marks), candidate_ids)
+        where = rng.integers(len(locations), size=count)
+        yield [(prefs, *locations[w]) for prefs, w in zip(preferences, where)]
+
+def _seal_groups(batch, envelope_size):
+    """Split a batch into envelopes of up to envelope_size ballots from one location"""
+    by_location = {}
+    for preferences, electoral_district, polling_division in batch:
+        by_location.setdefault((electoral_district, polling_division), []).append(preferences)
+    groups = []
+    for location, ballots in by_location.items():
+        for start in range(0, len(ballots), envelope_size):
+            groups.append((location, ballots[start:start + envelope_size]))
+    return groups
+
+def _store(batch, encrypted, groups):
+    if groups is None:
+        Vote.objects.bulk_create([
+            Vote(preferences=token, electoral_district=district, polling_division=division)
+            for token, (_, district, division) in zip(encrypted, batch)
+        ])
+    else:
+        VoteBatch.objects.bulk_create([
+            VoteBatch(envelope=envelope, offsets=offsets, electoral_district=district, polling_division=division)
+            for (envelope, offsets), ((district, division), _) in zip(encrypted, groups)
+        ])
+    record_ballots(batch)
+
+def generate_election(ballots, candidate_ids, weights, marks, locations=None, batch_size=None,
+                      workers=None, envelope_size=0, seed=None, progress=None):
+    """
+    Store `ballots` encrypted synthetic ballots for `candidate_ids` and add
+    them to the tally counters. With envelope_size > 0 they are sealed as
+    VoteBatch envelopes of that many ballots instead of one Vote each.
+    `progress`, if given, is called after every stored batch with the number
+    of ballots stored so far and the elapsed seconds. Returns the metrics.
+    """
+    rng = np.random.default_rng(seed)
+    locations = locations or [(settings.VOTING_ELECTORAL_DISTRICT, settings.VOTING_POLLING_DIVISION)]
+    batch_size = batch_size or settings.VOTE_DECRYPT_CHUNK_SIZE
+    workers = workers or settings.VOTE_DECRYPT_WORKERS
+    keys = settings.ENCRYPTION_KEYS
+
+    started = time.monotonic()
+    stored = 0
+    pool = decryption_pool(keys, workers) if workers > 1 else None
+    cipher = make_cipher(keys)
+    pending = deque()
+
+    def finish(batch, groups, result):
+        nonlocal stored
+        _store(batch, result if pool is None else result.result(), groups)
+        stored += len(batch)
+        if progress:
+            progress(stored, time.monotonic() - started)
+
+    try:
+        for batch in _batches(rng, ballots, batch_size, candidate_ids, weights, marks, locations):
+            groups = _seal_groups(batch, envelope_size) if envelope_size else None
+            items = [prefs for prefs, _, _ in batch] if groups is None else [group for _, group in groups]
+            if pool is None:
+                finish(batch, groups, encrypt_chunk(items, cipher))
+                continue
+            # Keep up to 2 x workers batches encrypting while earlier ones are inserted
+            pending.append((batch, groups, pool.submit(encrypt_chunk, items)))
+            if len(pending) >= workers * 2:
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    return {'ballots': stored, 'elapsed': elapsed, 'rate': stored / elapsed if elapsed else 0.0}
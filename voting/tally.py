@@ -0,0 +1,51 @@
+"""
+Single-pass tally engine.
+
+Pure Python with no Django imports, so the results view, management commands
+and benchmark scripts can all share it. Ballots are decoded preference dicts
+of the form {'1': candidate_id, '2': candidate_id, '3': candidate_id}.
+"""
+
+RANKS = (1, 2, 3)
+RANK_KEYS = ('1', '2', '3')
+
+def empty_counts():
+    return dict.fromkeys(RANKS, 0)
+
+def count_ballots(ballots, candidate_ids=None):
+    """
+    Count every preference in one pass over `ballots` (any iterable).
+
+    When `candidate_ids` is given, only those candidates are counted and
+    preferences naming anyone else are reported as 'unknown'. Returns
+    {'counts': {candidate_id: {1: n, 2: n, 3: n}}, 'rank_totals': {1: n, ...},
+    'ballots': n, 'unknown': n}.
+    """
+    fixed = candidate_ids is not None
+    # Index candidates by id; a list per candidate keeps the hot loop cheap
+    index = {str(c_id): [0, 0, 0] for c_id in candidate_ids} if fixed else {}
+    ballots_seen = 0
+    unknown = 0
+
+    for prefs in ballots:
+        ballots_seen += 1
+        for position, key in enumerate(RANK_KEYS):
+            c_id = prefs.get(key)
+            if not c_id:
+                continue
+            row = index.get(c_id)
+            if row is None:
+                if fixed:
+                    unknown += 1
+                    continue
+                row = index[c_id] = [0, 0, 0]
+            row[position] += 1
+
+    counts = {c_id: dict(zip(RANKS, row)) for c_id, row in index.items()}
+    rank_totals = {rank: sum(row[position] for row in index.values()) for position, rank in enumerate(RANKS)}
+    return {
+        'counts': counts,
+        'rank_totals': rank_totals,
+        'ballots': ballots_seen,
+        'unknown': unknown,
+    }
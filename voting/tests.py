@@ -1,3 +1,756 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from unittest import mock
+import numpy as np
+from asgiref.sync import sync_to_async
+from cryptography.fernet import Fernet
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import reverse
+from django.utils.asyncio import async_unsafe
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from candidates.models import Candidate
+from .admission import AdmissionController, TokenBucket, admission_control
+from .checkpoint import merge_counts
+from .contingent import contingent_count, encode_ballots, rank_counts
+from .counters import TallyChanged, read_counts, rebuild_counters, record_ballot, region_keys, write_counters
+from .decryption import (
+    decrypt_chunk, encrypt_chunk, iter_decrypted_chunks, make_cipher, open_envelope, rotate_chunk, seal_envelope,
+)
+from .freeze import freeze_election
+from .group_commit import GroupCommitter, insert_unordered
+from .idempotency import RecentSubmissions, recent_submissions
+from .live import ResultsBroadcaster
+from .models import Vote
+from .snapshot import SnapshotError, load_snapshot, write_snapshot
+from .synthetic import generate_preferences, popularity, synthetic_candidates, to_preferences
+from .tally import count_ballots
+from .validation import CandidateIds, candidate_ids, polling_location, validate_preferences
+from .views import (
+    BALLOT_VERSION_KEY, RESULTS_VERSION_KEY, accept_ballot, index, requested_region, submit_vote, submit_vote_async,
+)
 
-# Create your tests here.
+
+class CountBallotsTest(SimpleTestCase):
+    def setUp(self):
+        self.ballots = [
+            {'1': 'a', '2': 'b', '3': 'c'},
+            {'1': 'b', '2': 'a'},
+            {'1': 'a'},
+            {'2': 'c', '3': 'x'},
+        ]
+
+    def test_single_pass_counts(self):
+        """Each rank is counted per candidate and ballots are totalled."""
+        tally = count_ballots(iter(self.ballots))
+        self.assertEqual(tally['ballots'], 4)
+        self.assertEqual(tally['counts']['a'], {1: 2, 2: 1, 3: 0})
+        self.assertEqual(tally['counts']['c'], {1: 0, 2: 1, 3: 1})
+        self.assertEqual(tally['rank_totals'], {1: 3, 2: 3, 3: 2})
+
+    def test_fixed_candidate_list(self):
+        """Preferences for ids outside the candidate list are reported as unknown."""
+        tally = count_ballots(self.ballots, candidate_ids=['a', 'b', 'c', 'd'])
+        self.assertEqual(tally['unknown'], 1)
+        self.assertNotIn('x', tally['counts'])
+        self.assertEqual(tally['counts']['d'], {1: 0, 2: 0, 3: 0})
+
+
+class ContingentCountTest(SimpleTestCase):
+    candidates = ['a', 'b', 'c', 'd']
+
+    def test_absolute_majority(self):
+        """A candidate with more than half the first preferences is elected outright."""
+        matrix = encode_ballots([{'1': 'a'}, {'1': 'a'}, {'1': 'b'}, {'2': 'b'}], self.candidates)
+        result = contingent_count(matrix, self.candidates)
+        self.assertEqual(result['valid_ballots'], 3)
+        self.assertFalse(result['contingent'])
+        self.assertEqual(result['elected'], 'a')
+
+    def test_second_and_third_preference_transfers(self):
+        """Eliminated ballots go to their 2nd preference, else their 3rd, if it is a finalist."""
+        ballots = (
+            [{'1': 'a'}] * 4
+            + [{'1': 'b'}] * 3
+            + [{'1': 'c', '2': 'b'}] * 2
+            + [{'1': 'd', '2': 'c', '3': 'b'}]
+            + [{'1': 'd', '2': 'c'}]
+        )
+        result = contingent_count(encode_ballots(ballots, self.candidates), self.candidates)
+        self.assertTrue(result['contingent'])
+        self.assertEqual(result['finalists'], ['a', 'b'])
+        self.assertEqual(result['transfers'], {'a': 0, 'b': 3})
+        self.assertEqual(result['final'], {'a': 4, 'b': 6})
+        self.assertEqual(result['elected'], 'b')
+        self.assertEqual(result['tie'], [])
+
+    def test_ties_are_reported_not_broken(self):
+        """A tie for a finalist place or in the final count elects nobody."""
+        ballots = [{'1': 'a'}] * 4 + [{'1': 'b'}] * 3 + [{'1': 'c'}] * 3
+        result = contingent_count(encode_ballots(ballots, self.candidates), self.candidates)
+        self.assertIsNone(result['elected'])
+        self.assertEqual(result['tie'], ['b', 'c'])
+        self.assertEqual(result['finalists'], [])
+
+        ballots = [{'1': 'a'}] * 4 + [{'1': 'b'}] * 3 + [{'1': 'c', '2': 'b'}]
+        result = contingent_count(encode_ballots(ballots, self.candidates), self.candidates)
+        self.assertEqual(result['final'], {'a': 4, 'b': 4})
+        self.assertIsNone(result['elected'])
+        self.assertEqual(result['tie'], ['a', 'b'])
+
+
+class BallotSnapshotTest(SimpleTestCase):
+    candidates = ['65a000000000000000000001', '65a000000000000000000002', '65a000000000000000000003']
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.snap')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        ballots = [
+            {'1': self.candidates[0], '2': self.candidates[1]},
+            {'1': self.candidates[2], '3': self.candidates[0]},
+            {'2': self.candidates[2]},
+        ]
+        self.matrix = encode_ballots(ballots, self.candidates)
+
+    def test_round_trip(self):
+        """A snapshot loads back as the same ballot matrix and candidate table."""
+        write_snapshot(self.path, self.matrix, self.candidates)
+        matrix, candidate_ids = load_snapshot(self.path)
+        self.assertEqual(candidate_ids, self.candidates)
+        self.assertEqual(matrix.tolist(), self.matrix.tolist())
+        self.assertEqual(rank_counts(matrix, candidate_ids)[self.candidates[0]], {1: 1, 2: 0, 3: 1})
+
+    def test_checksum_detects_corruption(self):
+        """Flipping a ballot byte makes the checksum fail."""
+        write_snapshot(self.path, self.matrix, self.candidates)
+        with open(self.path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\x09')
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.path)
+
+
+class MergeCountsTest(SimpleTestCase):
+    def test_merges_batches_into_stored_counts(self):
+        """Batch counts are added to the JSON-stored partial counts."""
+        stored = {'a': {'1': 2, '2': 1}}
+        merge_counts(stored, count_ballots([{'1': 'a'}, {'1': 'b', '3': 'a'}])['counts'])
+        self.assertEqual(stored, {'a': {'1': 3, '2': 1, '3': 1}, 'b': {'1': 1, '2': 0, '3': 0}})
+
+
+class ResultsApiTest(SimpleTestCase):
+    def setUp(self):
+        # Seed the per-version caches so the view never needs the database
+        cache.set(RESULTS_VERSION_KEY, 7)
+        cache.set(BALLOT_VERSION_KEY, 'b1')
+        cache.set('voting:results:data:7:b1:', [
+            {'id': 'a', 'name': 'A', 'party': 'SJB', 'color': '#008000', 'photo': None, 'counts': {1: 5, 2: 1, 3: 0}, 'total_1st': 5},
+            {'id': 'b', 'name': 'B', 'party': 'NPP', 'color': '#cc0000', 'photo': None, 'counts': {1: 3, 2: 4, 3: 2}, 'total_1st': 3},
+        ])
+        self.addCleanup(cache.clear)
+
+    def test_top_rank_and_fields(self):
+        """Rows are ordered by the selected rank and projected to the requested fields."""
+        response = self.client.get(reverse('results_api'), {'top': 1, 'rank': '2', 'fields': 'id,counts'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'version': 7, 'results': [{'id': 'b', 'counts': {'2': 4}}]})
+
+    def test_not_modified(self):
+        """A request carrying the current ETag gets a 304."""
+        etag = self.client.get(reverse('results_api'))['ETag']
+        response = self.client.get(reverse('results_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_candidate_change_invalidates_etag(self):
+        """An edited candidate or finished thumbnail changes the results without a new ballot."""
+        etag = self.client.get(reverse('results_api'))['ETag']
+        cache.set(BALLOT_VERSION_KEY, 'b2')
+        cache.set('voting:results:data:7:b2:', [])
+        response = self.client.get(reverse('results_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_invalid_rank(self):
+        response = self.client.get(reverse('results_api'), {'rank': '4'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_region_from_query(self):
+        factory = RequestFactory()
+        self.assertEqual(requested_region(factory.get('/', {'district': 'Colombo', 'division': 'Borella'})),
+                         'division:Colombo/Borella')
+        self.assertEqual(requested_region(factory.get('/', {'district': 'Colombo'})), 'district:Colombo')
+        self.assertEqual(requested_region(factory.get('/')), '')
+        # Borella alone would read an empty 'division:/Borella' region
+        self.assertEqual(self.client.get(reverse('results_api'), {'division': 'Borella'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('results'), {'division': 'Borella'}).status_code, 400)
+
+
+class LiveResultsTest(SimpleTestCase):
+    def test_stream_needs_live_results_enabled(self):
+        self.assertEqual(self.client.get(reverse('results_stream')).status_code, 404)
+
+    async def test_keep_alive_is_sent_without_holding_the_lock(self):
+        """A viewer that stops reading after a keep-alive must not block the other viewers."""
+        broadcaster = ResultsBroadcaster()
+        with self.settings(RESULTS_STREAM_HEARTBEAT_SECONDS=0.01, RESULTS_STREAM_TICK_SECONDS=0.01), \
+                mock.patch('voting.live.read_watermark', return_value=None):
+            stalled = broadcaster.updates()
+            self.assertIsNone(await anext(stalled))
+            self.assertFalse(broadcaster._condition.locked())
+            await stalled.aclose()
+
+
+class BallotPageCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_rendered_once_until_a_candidate_changes(self):
+        request = RequestFactory().get('/voting/')
+        with mock.patch('voting.views.ballot_candidates', return_value=[]) as candidates:
+            first = index(request)
+            second = index(request)
+            self.assertEqual(candidates.call_count, 1)
+            self.assertEqual(first.content, second.content)
+            self.assertIn('csrftoken', second.cookies)
+
+            post_delete.send(sender=Candidate, instance=Candidate())
+            index(request)
+            self.assertEqual(candidates.call_count, 2)
+
+
+class FreezeElectionTest(SimpleTestCase):
+    def test_pages_and_hashed_assets(self):
+        with tempfile.TemporaryDirectory() as media, tempfile.TemporaryDirectory() as output:
+            os.makedirs(os.path.join(media, 'party_symbols'))
+            with open(os.path.join(media, 'party_symbols', 'NPP.png'), 'wb') as f:
+                f.write(b'symbol')
+            with self.settings(MEDIA_ROOT=media):
+                candidate = Candidate(id='6560c0ffee0000000000abcd', full_name='Anura Kumara', ballot_name='A. Kumara',
+                                      party_name='NPP', candidate_photo='candidate_photos/missing.jpg')
+                candidate.update_display_fields()
+                with mock.patch('voting.freeze.ballot_candidates', return_value=[candidate]):
+                    manifest, missing = freeze_election(output)
+
+            self.assertEqual(missing, ['/media/candidate_photos/missing.jpg'])
+            hashed_url = manifest['/media/party_symbols/NPP.png']
+            self.assertRegex(hashed_url, r'^/voting/assets/npp\.[0-9a-f]{12}\.png$')
+            self.assertTrue(os.path.exists(os.path.join(output, hashed_url.lstrip('/'))))
+            with gzip.open(os.path.join(output, 'voting', 'index.html.gz')) as f:
+                ballot = f.read().decode()
+            self.assertIn(hashed_url, ballot)
+            self.assertIn('/voting/csrf/', ballot)
+            self.assertTrue(os.path.exists(os.path.join(output, 'voting', 'success', 'index.html.gz')))
+
+
+class MediaServingTest(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        os.makedirs(os.path.join(media.name, 'party_symbols'))
+        for name in ('SJB.png', 'sjb.3f2a9c1e04b7.png'):
+            with open(os.path.join(media.name, 'party_symbols', name), 'wb') as f:
+                f.write(b'0123456789')
+        override = self.settings(MEDIA_ROOT=media.name, MEDIA_SERVE_MODE='django')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_etag_and_cache_headers(self):
+        response = self.client.get('/media/party_symbols/SJB.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        revalidated = self.client.get('/media/party_symbols/SJB.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        hashed = self.client.get('/media/party_symbols/sjb.3f2a9c1e04b7.png')
+        self.assertEqual(hashed['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(hashed['ETag'], response['ETag'])
+
+    def test_ranges(self):
+        response = self.client.get('/media/party_symbols/SJB.png', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        suffix = self.client.get('/media/party_symbols/SJB.png', HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+        self.assertEqual(self.client.get('/media/party_symbols/SJB.png', HTTP_RANGE='bytes=20-').status_code, 416)
+
+    def test_offload_and_traversal(self):
+        with self.settings(MEDIA_SERVE_MODE='x-accel'):
+            response = self.client.get('/media/party_symbols/SJB.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/party_symbols/SJB.png')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/party_symbols/missing.png').status_code, 404)
+
+    def test_only_public_directories_are_served(self):
+        os.makedirs(os.path.join(self.media, 'form_a'))
+        with open(os.path.join(self.media, 'form_a', 'nomination.pdf'), 'wb') as f:
+            f.write(b'private')
+        for path in ('/media/form_a/nomination.pdf', '/media/party_symbols/../form_a/nomination.pdf'):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+
+class RegionKeysTest(SimpleTestCase):
+    def test_ballot_counts_towards_nation_district_and_division(self):
+        self.assertEqual(
+            region_keys('Colombo', 'Borella'),
+            ['', 'district:Colombo', 'division:Colombo/Borella'],
+        )
+        self.assertEqual(region_keys(None, None), [''])
+
+
+class TallyCountersTest(SimpleTestCase):
+    def test_record_ballot_bumps_each_region_once(self):
+        with mock.patch('voting.counters.connection') as connection:
+            record_ballot({'1': 'a', '2': 'b'}, 'Colombo', 'Borella')
+        counters, watermark = connection.get_collection.return_value.bulk_write.call_args_list
+        self.assertCountEqual(counters.args[0], [
+            UpdateOne({'region': region, 'candidate_id': c_id, 'rank': rank}, {'$inc': {'count': 1}}, upsert=True)
+            for region in ('', 'district:Colombo', 'division:Colombo/Borella')
+            for c_id, rank in (('a', 1), ('b', 2))
+        ])
+        self.assertEqual(watermark.args[0], [
+            UpdateOne({'name': 'results'}, {'$inc': {'version': 1, 'ballots': 1}}, upsert=True),
+        ])
+
+    def test_concurrently_created_counter_is_updated(self):
+        with mock.patch('voting.counters.connection') as connection:
+            bulk_write = connection.get_collection.return_value.bulk_write
+            bulk_write.side_effect = [
+                BulkWriteError({'writeErrors': [{'index': 0, 'code': 11000, 'errmsg': 'duplicate'}]}), None, None,
+            ]
+            record_ballot({'1': 'a'})
+        first, retry, _ = bulk_write.call_args_list
+        self.assertEqual(retry.args[0], first.args[0][:1])
+
+    def test_read_counts_fills_missing_ranks(self):
+        with mock.patch('voting.counters.TallyCounter') as counter:
+            counter.objects.filter.return_value.values_list.return_value = [('a', 1, 5), ('a', 3, 2), ('b', 2, 1)]
+            counts = read_counts('district:Colombo')
+        counter.objects.filter.assert_called_once_with(region='district:Colombo')
+        self.assertEqual(counts, {'a': {1: 5, 2: 0, 3: 2}, 'b': {1: 0, 2: 1, 3: 0}})
+
+    def test_rebuild_rolls_locations_up_to_district_and_nation(self):
+        ballots = {
+            ('Colombo', 'Borella'): [{'1': 'a'}, {'1': 'b', '2': 'a'}],
+            ('Colombo', 'Maharagama'): [{'1': 'a'}],
+        }
+        with mock.patch('voting.counters.Vote') as vote, mock.patch('voting.counters.VoteBatch') as batch, \
+                mock.patch('voting.counters.TallyCounter'), \
+                mock.patch('voting.counters.stream_ballots', side_effect=lambda electoral_district, polling_division, **kw:
+                           iter(ballots[electoral_district, polling_division])), \
+                mock.patch('voting.counters.read_watermark', return_value=4), \
+                mock.patch('voting.counters.write_counters') as write:
+            vote.objects.values_list.return_value.distinct.return_value = [('Colombo', 'Borella')]
+            batch.objects.values_list.return_value.distinct.return_value = [('Colombo', 'Maharagama')]
+            total, errors = rebuild_counters(workers=1)
+        self.assertEqual(total, 3)
+        counts, ballots_counted = write.call_args.args
+        self.assertEqual(ballots_counted, 3)
+        self.assertEqual(write.call_args.kwargs, {'expected_version': 4, 'replace_all': True})
+        self.assertEqual(counts['']['a'], {1: 2, 2: 1, 3: 0})
+        self.assertEqual(counts['district:Colombo'], counts[''])
+        self.assertEqual(counts['division:Colombo/Maharagama'], {'a': {1: 1, 2: 0, 3: 0}})
+
+    def test_rebuild_keeps_live_counters_when_ballots_arrived_meanwhile(self):
+        with mock.patch('voting.counters.TallyCounter') as counter, \
+                mock.patch('voting.counters.TallyWatermark') as watermark:
+            watermark.objects.filter.return_value.filter.return_value.update.return_value = 0
+            with self.assertRaises(TallyChanged):
+                write_counters({'': {'a': {1: 2, 2: 0, 3: 0}}}, 2, expected_version=4)
+            list(counter.objects.bulk_create.call_args.args[0])
+        watermark.objects.filter.return_value.filter.assert_called_once_with(version=4)
+        self.assertEqual(counter.call_args_list, [mock.call(region='rebuild:', candidate_id='a', rank=1, count=2)])
+        # Only the staged rows are dropped
+        self.assertEqual(counter.objects.filter.return_value.delete.call_count, 2)
+        counter.objects.filter.assert_called_with(region__startswith='rebuild:')
+        counter.objects.exclude.assert_not_called()
+
+
+class SubmitVoteContractTest(SimpleTestCase):
+    """The sync and async submit views answer the same way before touching the database."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def empty_ballot(self):
+        return self.factory.post('/voting/submit/', {'preferences': {}}, content_type='application/json')
+
+    async def test_rejections_match(self):
+        responses = [
+            submit_vote(self.empty_ballot()),
+            await submit_vote_async(self.empty_ballot()),
+        ]
+        for response in responses:
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content)['message'], 'No preferences selected')
+
+        self.assertEqual(submit_vote(self.factory.get('/voting/submit/')).status_code, 405)
+        self.assertEqual((await submit_vote_async(self.factory.get('/voting/submit/'))).status_code, 405)
+
+    def test_group_commit_timeout_asks_to_retry(self):
+        request = self.factory.post('/voting/submit/', {'preferences': {'1': 'a'}}, content_type='application/json')
+        with mock.patch.object(candidate_ids, 'get', return_value=frozenset({'a'})), \
+                mock.patch('voting.views.accept_ballot', side_effect=FutureTimeoutError):
+            response = submit_vote(request)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+
+    def test_stored_ballot_is_accepted_when_the_tally_update_fails(self):
+        with mock.patch('voting.views.group_commit_enabled', return_value=False), \
+                mock.patch.object(Vote, 'save'), \
+                mock.patch('voting.views.record_ballot', side_effect=DatabaseError('down')), \
+                self.assertLogs('voting.views', 'ERROR'):
+            self.assertTrue(accept_ballot({'1': 'a'}, None, None))
+
+
+class GroupCommitTest(SimpleTestCase):
+    def setUp(self):
+        self.committer = GroupCommitter(max_batch=10, max_wait=0)
+        for target in ('voting.group_commit.close_old_connections', 'voting.group_commit.record_ballots'):
+            patcher = mock.patch(target)
+            setattr(self, target.rsplit('.', 1)[1], patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def item(self, submission_id=None, candidate='a'):
+        return Vote(submission_id=submission_id), {'1': candidate}, Future()
+
+    def test_each_future_gets_its_own_outcome(self):
+        batch = [self.item('s1'), self.item('s1'), self.item('s2'), self.item('s3'), self.item(None, 'b'), self.item('s4')]
+        # s3 was stored by another process meanwhile; s4 fails for another reason
+        failed = {1: {'index': 1, 'code': 11000, 'errmsg': 'duplicate'}, 3: {'index': 3, 'code': 121, 'errmsg': 'invalid'}}
+        with mock.patch('voting.group_commit.stored_submission_ids', return_value={'s2'}), \
+                mock.patch('voting.group_commit.insert_unordered', return_value=failed) as insert:
+            self.committer._commit(batch)
+        # The in-batch duplicate of s1 and the already stored s2 are never inserted
+        self.assertEqual([vote.submission_id for vote in insert.call_args.args[1]], ['s1', 's3', None, 's4'])
+        results = [future.exception() or future.result() for _, _, future in batch]
+        self.assertEqual(results[:5], [True, False, False, False, True])
+        self.assertIsInstance(results[5], DatabaseError)
+        self.record_ballots.assert_called_once_with([({'1': 'a'}, None, None), ({'1': 'b'}, None, None)])
+
+    def test_failed_batch_resolves_every_future(self):
+        batch = [self.item(), self.item()]
+        with mock.patch('voting.group_commit.insert_unordered', side_effect=DatabaseError('down')):
+            self.committer._commit(batch)
+        for _, _, future in batch:
+            self.assertIsInstance(future.exception(timeout=0), DatabaseError)
+        self.record_ballots.assert_not_called()
+
+    def test_failed_envelope_insert_stores_no_submission_ids(self):
+        """A ballot whose envelope wasn't stored is stored by its retry, not answered as a duplicate."""
+        with self.settings(VOTE_STORAGE_MODE='envelope'), \
+                mock.patch('voting.group_commit.stored_submission_ids', side_effect=lambda ids: set()), \
+                mock.patch('voting.group_commit.seal_ballots', return_value=('token', [10])):
+            first = [self.item('s1')]
+            with mock.patch('voting.group_commit.insert_unordered', side_effect=DatabaseError('down')):
+                self.committer._commit(first)
+            self.assertIsInstance(first[0][2].exception(timeout=0), DatabaseError)
+
+            retry = [self.item('s1')]
+            with mock.patch('voting.group_commit.insert_unordered', return_value={}) as insert:
+                self.committer._commit(retry)
+            self.assertIs(retry[0][2].result(timeout=0), True)
+            envelope = insert.call_args.args[1][0]
+            self.assertEqual(envelope.submission_ids, ['s1'])
+
+    def test_envelope_racing_another_process_is_sealed_again(self):
+        batch = [self.item('s1'), self.item('s2', 'b')]
+        duplicate = {0: {'index': 0, 'code': 11000, 'errmsg': 'duplicate'}}
+        with self.settings(VOTE_STORAGE_MODE='envelope'), \
+                mock.patch('voting.group_commit.stored_submission_ids', side_effect=[set(), {'s1'}]), \
+                mock.patch('voting.group_commit.seal_ballots', return_value=('token', [10])), \
+                mock.patch('voting.group_commit.insert_unordered', side_effect=[duplicate, {}]) as insert:
+            self.committer._commit(batch)
+        self.assertEqual(insert.call_args.args[1][0].submission_ids, ['s2'])
+        self.assertEqual([future.result(timeout=0) for _, _, future in batch], [False, True])
+        self.record_ballots.assert_called_once_with([({'1': 'b'}, None, None)])
+
+    def test_unordered_insert_reports_write_errors(self):
+        errors = [{'index': 1, 'code': 11000, 'errmsg': 'duplicate'}]
+        with mock.patch('voting.group_commit.connection') as conn:
+            conn.get_collection.return_value.insert_many.side_effect = BulkWriteError({'writeErrors': errors})
+            failed = insert_unordered(Vote, [Vote(submission_id='a'), Vote(submission_id='a')])
+        self.assertEqual(failed, {1: errors[0]})
+        self.assertEqual(conn.get_collection.return_value.insert_many.call_args.kwargs, {'ordered': False})
+
+    def test_unacknowledged_batch_times_out(self):
+        committer = mock.Mock()
+        committer.submit.return_value = Future()
+        request = RequestFactory().post('/voting/submit/', {'preferences': {'1': 'a'}}, content_type='application/json')
+        with self.settings(VOTING_GROUP_COMMIT=True, VOTING_GROUP_COMMIT_TIMEOUT=0.01), \
+                mock.patch('voting.views.get_group_committer', return_value=committer), \
+                mock.patch.object(candidate_ids, 'get', return_value=frozenset({'a'})):
+            response = submit_vote(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class IdempotentSubmitTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        patcher = mock.patch.object(candidate_ids, 'get', return_value=frozenset({'a'}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ballot(self, submission_id, **headers):
+        body = {'preferences': {'1': 'a'}}
+        if submission_id:
+            body['submission_id'] = submission_id
+        return self.factory.post('/voting/submit/', body, content_type='application/json', headers=headers)
+
+    def test_recent_submissions_evicts_least_recent(self):
+        recent = RecentSubmissions(2)
+        recent.add('a')
+        recent.add('b')
+        self.assertIn('a', recent)
+        recent.add('c')
+        self.assertNotIn('b', recent)
+        self.assertIn('a', recent)
+
+    async def test_replayed_retry_answers_success(self):
+        recent_submissions.add('retry-1')
+        for response in (
+            submit_vote(self.ballot('retry-1')),
+            submit_vote(self.ballot(None, idempotency_key='retry-1')),
+            await submit_vote_async(self.ballot('retry-1')),
+        ):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), {'status': 'success'})
+            self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_oversized_submission_id(self):
+        self.assertEqual(submit_vote(self.ballot('x' * 65)).status_code, 400)
+
+
+class AdmissionControlTest(SimpleTestCase):
+    def test_token_bucket_refills(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+        bucket.updated -= 0.1
+        self.assertEqual(bucket.take(), 0)
+
+    def test_bounded_queue(self):
+        controller = AdmissionController(rate=1, burst=1, max_concurrent=1, max_queue=0, queue_timeout=0.01)
+        self.assertTrue(controller.enter())
+        self.assertFalse(controller.enter())
+        controller.max_queue = 1
+        self.assertFalse(controller.enter())
+        controller.leave()
+        self.assertTrue(controller.enter())
+        metrics = controller.metrics()
+        self.assertEqual((metrics['admitted'], metrics['shed'], metrics['timed_out']), (2, 1, 1))
+
+    def test_kiosk_over_rate_gets_retry_after(self):
+        controller = AdmissionController(rate=0.5, burst=1, max_concurrent=4, max_queue=4, queue_timeout=1)
+        request = RequestFactory().post('/voting/submit/', {'preferences': {}}, content_type='application/json',
+                                        headers={'X-Kiosk-Id': 'kiosk-7'})
+        with mock.patch('voting.admission.controller', controller):
+            self.assertEqual(submit_vote(request).status_code, 400)
+            response = submit_vote(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(controller.in_flight, 0)
+
+
+    def test_zero_rate_disables_the_kiosk_throttle(self):
+        controller = AdmissionController(rate=0, burst=1, max_concurrent=4, max_queue=4, queue_timeout=1)
+        self.assertEqual([controller.throttle('proxy') for _ in range(20)], [0] * 20)
+        self.assertEqual(controller.metrics()['throttled'], 0)
+
+    async def test_cancelled_queued_request_gives_its_slot_back(self):
+        controller = AdmissionController(rate=1, burst=10, max_concurrent=1, max_queue=4, queue_timeout=5)
+        controller.enter()
+
+        @admission_control
+        async def view(request):
+            return HttpResponse()
+
+        request = RequestFactory().post('/voting/submit/')
+        with mock.patch('voting.admission.controller', controller), self.settings(VOTING_ADMISSION_CONTROL=True):
+            task = asyncio.ensure_future(view(request))
+            while not controller.queued:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            controller.leave()
+        self.assertEqual((controller.counts['admitted'], controller.in_flight, controller.queued), (1, 0, 0))
+
+    async def test_freed_slot_is_handed_to_the_oldest_async_waiter(self):
+        controller = AdmissionController(rate=0, burst=1, max_concurrent=1, max_queue=4, queue_timeout=5)
+        self.assertTrue(await controller.enter_async())
+        first = asyncio.ensure_future(controller.enter_async())
+        second = asyncio.ensure_future(controller.enter_async())
+        while controller.queued < 2:
+            await asyncio.sleep(0.01)
+        # Freed by a sync view's thread
+        await asyncio.to_thread(controller.leave)
+        self.assertTrue(await first)
+        self.assertFalse(second.done())
+        controller.leave()
+        self.assertTrue(await second)
+        controller.leave()
+        self.assertEqual((controller.counts['admitted'], controller.in_flight, controller.queued), (3, 0, 0))
+
+    async def test_queued_requests_leave_executor_threads_to_admitted_ones(self):
+        """Waiting for a slot must not starve the threads the admitted submissions run in."""
+        controller = AdmissionController(rate=0, burst=1, max_concurrent=2, max_queue=64, queue_timeout=5)
+
+        @admission_control
+        async def view(request):
+            await sync_to_async(time.sleep, thread_sensitive=False)(0.01)
+            return HttpResponse()
+
+        request = RequestFactory().post('/voting/submit/')
+        executor = ThreadPoolExecutor(8)
+        self.addCleanup(executor.shutdown)
+        asyncio.get_running_loop().set_default_executor(executor)
+        started = time.monotonic()
+        with mock.patch('voting.admission.controller', controller), self.settings(VOTING_ADMISSION_CONTROL=True):
+            responses = await asyncio.gather(*(view(request) for _ in range(40)))
+        self.assertEqual([response.status_code for response in responses], [200] * 40)
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class ValidatePreferencesTest(SimpleTestCase):
+    def setUp(self):
+        self.valid_ids = frozenset({'a', 'b'})
+
+    def test_valid_ballot(self):
+        validate_preferences({'1': 'a', '3': 'b'}, self.valid_ids)
+
+    def test_rejects_malformed_ballots(self):
+        for preferences in (['a'], {'4': 'a'}, {'1': 'z'}, {'1': 1}, {'1': 'a', '2': 'a'}):
+            with self.assertRaises(ValidationError):
+                validate_preferences(preferences, self.valid_ids)
+
+    def test_invalidate_reloads_ids(self):
+        loads = []
+        ids = CandidateIds(lambda: loads.append(1) or ['a'], max_age=60)
+        self.assertEqual(ids.get(), {'a'})
+        ids.get()
+        self.assertEqual(len(loads), 1)
+        ids.invalidate()
+        ids.get()
+        self.assertEqual(len(loads), 2)
+
+    def test_submit_rejects_unknown_candidate(self):
+        request = RequestFactory().post('/voting/submit/', {'preferences': {'1': 'z'}}, content_type='application/json')
+        with mock.patch.object(candidate_ids, 'get', return_value=self.valid_ids):
+            response = submit_vote(request)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_submit_loads_ids_off_the_event_loop(self):
+        """The ORM query behind the id set must not run on the event loop."""
+        @async_unsafe
+        def values_list(*args, **kwargs):
+            return ['a']
+        candidate_ids.invalidate()
+        self.addCleanup(candidate_ids.invalidate)
+        request = RequestFactory().post('/voting/submit/', {'preferences': {'1': 'a'}}, content_type='application/json')
+        with mock.patch.object(Candidate.objects, 'values_list', side_effect=values_list), \
+                mock.patch('voting.views.accept_ballot', return_value=True):
+            response = await submit_vote_async(request)
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_polling_location_must_be_configured(self):
+        with self.settings(VOTING_ELECTORAL_DISTRICT='Colombo', VOTING_POLLING_DIVISION='Borella',
+                           VOTING_POLLING_LOCATIONS=['Gampaha/Negombo']):
+            self.assertEqual(polling_location({}), ('Colombo', 'Borella'))
+            self.assertEqual(
+                polling_location({'electoral_district': 'Gampaha', 'polling_division': 'Negombo'}),
+                ('Gampaha', 'Negombo'),
+            )
+            for data in ({'electoral_district': 'Atlantis'}, {'polling_division': ['Borella']}):
+                with self.assertRaises(ValidationError):
+                    polling_location(data)
+            request = RequestFactory().post('/voting/submit/', {'preferences': {'1': 'a'}, 'polling_division': 'x'},
+                                            content_type='application/json')
+            with mock.patch.object(candidate_ids, 'get', return_value=self.valid_ids):
+                response = submit_vote(request)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content)['message'], 'Unknown polling location')
+
+
+class BatchEnvelopeTest(SimpleTestCase):
+    def setUp(self):
+        self.cipher = Fernet(Fernet.generate_key())
+        self.ballots = [{'1': 'a', '2': 'b'}, {'1': 'c'}, {'2': 'a', '3': 'b'}]
+
+    def test_envelope_splits_back_into_ballots(self):
+        token, offsets = seal_envelope(self.cipher, self.ballots)
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual(open_envelope(self.cipher, token, offsets), self.ballots)
+
+    def test_mixed_chunk(self):
+        """Per-ballot tokens and envelopes decrypt together; a bad envelope skips all its ballots."""
+        envelope = seal_envelope(self.cipher, self.ballots)
+        single = self.cipher.encrypt(b'{"1": "d"}').decode()
+        foreign = seal_envelope(Fernet(Fernet.generate_key()), self.ballots)
+        ballots, errors = decrypt_chunk([single, envelope, foreign, 'not-a-token'], self.cipher)
+        self.assertEqual(ballots, [{'1': 'd'}] + self.ballots)
+        self.assertEqual(errors, 4)
+
+    def test_plaintext_and_missing_preferences_are_skipped(self):
+        """Kiosk ballots stored as a plain dict, or without preferences, count as one error each."""
+        single = self.cipher.encrypt(b'{"1": "d"}').decode()
+        keys = [Fernet.generate_key().decode()]
+        with mock.patch('voting.decryption.make_cipher', return_value=self.cipher):
+            chunks = list(iter_decrypted_chunks([{'1': 'a', '2': 'b'}, None, single], keys, workers=1, chunk_size=2))
+        self.assertEqual(chunks, [([], 2), ([{'1': 'd'}], 0)])
+
+
+class SyntheticElectionTest(SimpleTestCase):
+    def test_ballots_rank_distinct_candidates(self):
+        rng = np.random.default_rng(0)
+        weights = popularity(5, 'zipf', 1.5)
+        matrix = generate_preferences(rng, 2000, weights, [0.2, 0.3, 0.5])
+        marked = (matrix >= 0).sum(axis=1)
+        self.assertEqual(set(marked.tolist()), {1, 2, 3})
+        for row in matrix[marked == 3]:
+            self.assertEqual(len(set(row.tolist())), 3)
+        # The most popular candidate gets the most first preferences
+        self.assertEqual(np.bincount(matrix[:, 0]).argmax(), 0)
+
+        ballots = to_preferences(matrix[:3], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual([len(b) for b in ballots], marked[:3].tolist())
+
+    def test_encrypted_ballots_decrypt(self):
+        cipher = make_cipher(Fernet.generate_key().decode())
+        ballots = [{'1': 'a'}, {'1': 'b', '2': 'a'}]
+        items = encrypt_chunk([ballots[0], ballots], cipher)
+        self.assertEqual(decrypt_chunk(items, cipher), ([ballots[0]] + ballots, 0))
+
+    def test_candidates_are_valid(self):
+        self.assertEqual(len(synthetic_candidates(12, np.random.default_rng(0))), 12)
+
+    def test_command_needs_debug_or_confirm(self):
+        with self.settings(DEBUG=False), self.assertRaisesMessage(CommandError, '--confirm'):
+            call_command('generate_election', '--ballots', '1')
+
+
+class KeyRotationTest(SimpleTestCase):
+    def test_rotated_tokens_only_need_the_new_key(self):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        token = make_cipher([old_key]).encrypt(b'{"1": "a"}').decode()
+        rotated, errors = rotate_chunk([('v1', token), ('v2', 'garbage')], make_cipher([new_key, old_key]))
+        self.assertEqual(errors, 1)
+        self.assertEqual(rotated[0][0], 'v1')
+        ballots, _ = decrypt_chunk([rotated[0][1]], make_cipher([new_key]))
+        self.assertEqual(ballots, [{'1': 'a'}])
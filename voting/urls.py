@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
     path('', views.index, name='voting_index'),
-    path('submit/', views.submit_vote, name='submit_vote'),
+    path('submit/', views.submit_vote_async if settings.VOTING_ASYNC_SUBMIT else views.submit_vote, name='submit_vote'),
     path('success/', views.success, name='vote_success'),
+    path('csrf/', views.csrf_bootstrap, name='csrf_bootstrap'),
     path('results/', views.results, name='results'),
+    path('results/stream/', views.results_stream, name='results_stream'),
+    path('api/results/', views.results_api, name='results_api'),
+    path('api/admission/', views.admission_metrics, name='admission_metrics'),
 ]
@@ -0,0 +1,99 @@
+"""
+Ballot validation for submit_vote.
+
+The ids of all candidates are loaded once into a frozenset and reused, so
+checking a ballot is a set lookup per preference rather than a database
+query. Saving or deleting a Candidate clears the set in that process (see
+signals.py); other processes reload it after VOTING_CANDIDATE_IDS_MAX_AGE
+seconds at most. Loading queries the database, so async views load the
+set in a worker thread (see submit_vote_async).
+
+The polling location a ballot reports must be the configured station or
+one of VOTING_POLLING_LOCATIONS, since every new location adds a set of
+tally counters.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from .tally import RANK_KEYS
+
+
+class CandidateIds:
+    """Lazily loaded, invalidatable set of valid candidate ids"""
+
+    def __init__(self, loader, max_age):
+        self.loader = loader
+        self.max_age = max_age
+        self._ids = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def loaded(self):
+        """The current set, or None if it has to be (re)loaded first"""
+        ids = self._ids
+        if ids is not None and time.monotonic() - self._loaded_at < self.max_age:
+            return ids
+        return None
+
+    def get(self):
+        ids = self.loaded()
+        if ids is not None:
+            return ids
+        with self._lock:
+            if self._ids is None or time.monotonic() - self._loaded_at >= self.max_age:
+                self._ids = frozenset(self.loader())
+                self._loaded_at = time.monotonic()
+            return self._ids
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+
+def load_candidate_ids():
+    from candidates.models import Candidate
+    return (str(pk) for pk in Candidate.objects.values_list('id', flat=True))
+
+candidate_ids = CandidateIds(load_candidate_ids, settings.VOTING_CANDIDATE_IDS_MAX_AGE)
+
+def validate_preferences(preferences, valid_ids=None):
+    """
+    Raise ValidationError unless preferences maps ranks '1'-'3' to distinct
+    known candidate ids. Runs before the ballot is encrypted.
+    """
+    if not isinstance(preferences, dict):
+        raise ValidationError('Preferences must be an object')
+    if valid_ids is None:
+        valid_ids = candidate_ids.get()
+    seen = set()
+    for rank, candidate_id in preferences.items():
+        if rank not in RANK_KEYS:
+            raise ValidationError(f'Invalid rank: {rank}')
+        if not isinstance(candidate_id, str) or candidate_id not in valid_ids:
+            raise ValidationError(f'Unknown candidate for rank {rank}')
+        if candidate_id in seen:
+            raise ValidationError('A candidate can only be given one preference')
+        seen.add(candidate_id)
+
+def allowed_locations():
+    """(electoral_district, polling_division) pairs ballots may be counted under"""
+    locations = {(settings.VOTING_ELECTORAL_DISTRICT, settings.VOTING_POLLING_DIVISION)}
+    for entry in settings.VOTING_POLLING_LOCATIONS:
+        district, _, division = entry.partition('/')
+        locations.add((district.strip() or None, division.strip() or None))
+    return locations
+
+def polling_location(data):
+    """
+    Return the (electoral_district, polling_division) of a submitted ballot:
+    the kiosk's configured station unless the client reports an allowed one.
+    """
+    electoral_district = data.get('electoral_district') or settings.VOTING_ELECTORAL_DISTRICT
+    polling_division = data.get('polling_division') or settings.VOTING_POLLING_DIVISION
+    for value in (electoral_district, polling_division):
+        if value is not None and not isinstance(value, str):
+            raise ValidationError('Invalid polling location')
+    if (electoral_district, polling_division) not in allowed_locations():
+        raise ValidationError('Unknown polling location')
+    return electoral_district, polling_division
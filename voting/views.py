@@ -1,122 +1,264 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from candidates.models import Candidate
 from .models import Vote
+from .admission import admission_control, controller as admission_controller, retry_response
+from .ballots import ENVELOPE, encrypt_preferences
+from .counters import read_counts, read_watermark, record_ballot, region_keys
+from .group_commit import get_group_committer, group_commit_enabled
+from .idempotency import MAX_SUBMISSION_ID_LENGTH, recent_submissions, submission_id_from
+from .live import results_events
+from .tally import empty_counts
+from .validation import candidate_ids, polling_location, validate_preferences
 import json
+import logging
+import uuid
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.conf import settings
-from cryptography.fernet import Fernet
-
-# Initialize Fernet
-cipher_suite = Fernet(settings.ENCRYPTION_KEY.encode())
-
-def get_party_color(party_name):
-    colors = {
-        "SJB": "#008000", # Green
-        "UNP": "#008000", # Green
-        "SLPP": "#800000", # Maroon
-        "NPP": "#cc0000", # Red
-        "SLFP": "#0000FF", # Blue
-        "Independent": "#808080" # Grey
-    }
-    return colors.get(party_name, "#666666")
-
-def get_party_symbol(party_name):
-    """Map party names to their symbol image filenames"""
-    symbols = {
-        "SJB": "SJB.png",
-        "SLPP": "SLPP.png",
-        "NPP": "NPP.png",
-        "SLFP": "SLFP.png",
-        "UNP": "Democratic United National Front.png",  # Assuming UNP uses this
-        "MJP": "MJP.png",
-    }
-    return symbols.get(party_name, None)
+
+RESULTS_VERSION_KEY = 'voting:results:version'
+BALLOT_VERSION_KEY = 'voting:ballot:version'
+API_FIELDS = ('id', 'name', 'party', 'color', 'photo', 'counts')
+
+logger = logging.getLogger(__name__)
+
+def ballot_version():
+    """Token naming the current rendering of the ballot page; replaced whenever a candidate changes"""
+    version = cache.get(BALLOT_VERSION_KEY)
+    if version is None:
+        cache.add(BALLOT_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(BALLOT_VERSION_KEY)
+    return version
+
+def invalidate_ballot_page():
+    cache.set(BALLOT_VERSION_KEY, uuid.uuid4().hex, None)
+
+def ballot_candidates():
+    # Display fields are stored on save, so only the columns the ballot shows are fetched
+    return list(Candidate.objects.only(*Candidate.BALLOT_FIELDS))
 
 @ensure_csrf_cookie
 def index(request):
-    candidates_qs = Candidate.objects.all()
-    candidates = []
-    for c in candidates_qs:
-        # Add color and party symbol attributes dynamically for the template
-        c.color = get_party_color(c.party_name)
-        symbol_filename = get_party_symbol(c.party_name)
-        if symbol_filename:
-            c.party_symbol_url = f"{settings.MEDIA_URL}party_symbols/{symbol_filename}"
-        else:
-            c.party_symbol_url = None
-        
-        # Extract short English name (first and last name only)
-        name_parts = c.full_name.split()
-        if len(name_parts) >= 2:
-            c.short_name = f"{name_parts[0]} {name_parts[-1]}"
-        else:
-            c.short_name = c.full_name
-        
-        candidates.append(c)
-        
-    return render(request, 'voting/index.html', {'candidates': candidates})
+    # The ballot has nothing request-specific, so it is rendered once per candidate
+    # list and served from the cache until a Candidate is saved or deleted
+    page_key = f"voting:ballot:page:{ballot_version()}"
+    content = cache.get(page_key)
+    if content is None:
+        content = render_to_string('voting/index.html', {'candidates': ballot_candidates()})
+        cache.set(page_key, content, settings.VOTING_BALLOT_CACHE_SECONDS)
+    return HttpResponse(content)
+
+@ensure_csrf_cookie
+@never_cache
+def csrf_bootstrap(request):
+    """Sets the CSRF cookie for ballots served as a frozen static page (see freeze.py)"""
+    return HttpResponse(status=204)
 
+def read_ballot(data):
+    """Return (preferences, electoral_district, polling_division) from a submitted JSON body"""
+    preferences = data.get('preferences', {})
+    # Tag the ballot with its polling location (checked in check_submission)
+    electoral_district, polling_division = polling_location(data)
+    return preferences, electoral_district, polling_division
+
+def build_vote(preferences, electoral_district, polling_division, submission_id=None):
+    """An unsaved Vote holding the encrypted preferences"""
+    # Encrypt Preferences (in envelope mode they are sealed later, with the whole batch)
+    encrypted_data = '' if settings.VOTE_STORAGE_MODE == ENVELOPE else encrypt_preferences(preferences)
+    return Vote(
+        preferences=encrypted_data,
+        electoral_district=electoral_district,
+        polling_division=polling_division,
+        submission_id=submission_id,
+    )
+
+def accept_ballot(preferences, electoral_district, polling_division, submission_id=None):
+    """Encrypt, store and count one ballot. Returns False if submission_id was already stored."""
+    vote = build_vote(preferences, electoral_district, polling_division, submission_id)
+    
+    if group_commit_enabled():
+        # Stored in a bulk insert with other concurrent ballots; wait for its acknowledgement
+        return get_group_committer().submit(vote, preferences).result(timeout=settings.VOTING_GROUP_COMMIT_TIMEOUT)
+    
+    # Create Vote
+    try:
+        vote.save()
+    except IntegrityError:
+        if submission_id:
+            # Retry of a ballot that is already stored
+            return False
+        raise
+    
+    # Keep the materialized tally in step with the stored ballots
+    try:
+        record_ballot(preferences, electoral_district, polling_division)
+    except Exception:
+        # The ballot is stored; rebuild_tally will reconcile the counters
+        logger.exception("Error updating tally for vote %s", vote.pk)
+    return True
+
+def check_submission(request, data, valid_ids=None):
+    """
+    Validate a submission before encrypting and storing it. Returns (submission_id, response);
+    response is set when the request can be answered straight away. valid_ids defaults to
+    the cached candidate id set, which may query the database.
+    """
+    preferences = data.get('preferences', {})
+    if not preferences:
+        return None, JsonResponse({'status': 'error', 'message': 'No preferences selected'}, status=400)
+    try:
+        validate_preferences(preferences, valid_ids)
+        polling_location(data)
+    except ValidationError as e:
+        return None, JsonResponse({'status': 'error', 'message': e.messages[0]}, status=400)
+    
+    submission_id = submission_id_from(request, data)
+    if submission_id and len(submission_id) > MAX_SUBMISSION_ID_LENGTH:
+        return None, JsonResponse({'status': 'error', 'message': 'Invalid submission id'}, status=400)
+    if submission_id and submission_id in recent_submissions:
+        return submission_id, submitted_response(stored=False)
+    return submission_id, None
+
+def submitted_response(stored):
+    """Success response; a replayed retry gets the same body as the original submission"""
+    response = JsonResponse({'status': 'success'})
+    if not stored:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+@admission_control
 def submit_vote(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            preferences = data.get('preferences', {})
+            submission_id, response = check_submission(request, data)
+            if response:
+                return response
             
-            if not preferences:
-                return JsonResponse({'status': 'error', 'message': 'No preferences selected'}, status=400)
+            preferences, electoral_district, polling_division = read_ballot(data)
+            stored = accept_ballot(preferences, electoral_district, polling_division, submission_id)
+            if submission_id:
+                recent_submissions.add(submission_id)
             
-            # Encrypt Preferences
-            json_str = json.dumps(preferences)
-            encrypted_data = cipher_suite.encrypt(json_str.encode()).decode()
+            return submitted_response(stored)
+        except FutureTimeoutError:
+            # Its batch may still be stored; the retry is answered by idempotency
+            return retry_response(503, 'Timed out storing the ballot, retry shortly', 1)
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+@admission_control
+async def submit_vote_async(request):
+    """
+    submit_vote for ASGI deployments (VOTING_ASYNC_SUBMIT). Same request and
+    response contract, but encryption and the MongoDB writes run in the
+    thread pool so the event loop keeps accepting other voters meanwhile.
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            # Loading the candidate id set queries the database, which can't run on the event loop
+            valid_ids = candidate_ids.loaded()
+            if valid_ids is None and data.get('preferences'):
+                valid_ids = await sync_to_async(candidate_ids.get, thread_sensitive=False)()
+            submission_id, response = check_submission(request, data, valid_ids)
+            if response:
+                return response
             
-            # Create Vote
-            Vote.objects.create(preferences=encrypted_data)
+            preferences, electoral_district, polling_division = read_ballot(data)
+            # thread_sensitive=False: run in the shared pool, not serialized on one thread
+            if group_commit_enabled():
+                vote = await sync_to_async(build_vote, thread_sensitive=False)(
+                    preferences, electoral_district, polling_division, submission_id
+                )
+                stored = await asyncio.wait_for(
+                    asyncio.wrap_future(get_group_committer().submit(vote, preferences)),
+                    settings.VOTING_GROUP_COMMIT_TIMEOUT,
+                )
+            else:
+                stored = await sync_to_async(accept_ballot, thread_sensitive=False)(
+                    preferences, electoral_district, polling_division, submission_id
+                )
+            if submission_id:
+                recent_submissions.add(submission_id)
             
-            return JsonResponse({'status': 'success'})
+            return submitted_response(stored)
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            # Its batch may still be stored; the retry is answered by idempotency
+            return retry_response(503, 'Timed out storing the ballot, retry shortly', 1)
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
     
     return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
 
-def results(request):
-    candidates_qs = Candidate.objects.all()
-    results_data = []
+def results_version(request):
+    """
+    Current tally version, re-read from the database at most once per
+    RESULTS_MIN_REFRESH_SECONDS so bursts of refreshes share one lookup.
+    """
+    version = cache.get(RESULTS_VERSION_KEY)
+    if version is None:
+        version = read_watermark()
+        cache.set(RESULTS_VERSION_KEY, version, settings.RESULTS_MIN_REFRESH_SECONDS)
+    return version
+
+def results_etag(request):
+    # Candidate edits and finished thumbnails change the page without a new ballot
+    return f"results-{results_version(request)}-{ballot_version()}"
+
+def requested_region(request):
+    """
+    Counter region selected by the ?district= and ?division= query parameters ('' = national).
+    Division names repeat across districts, so a division needs its district.
+    """
+    district = request.GET.get('district')
+    division = request.GET.get('division')
+    if division and not district:
+        raise ValidationError('division needs a district')
+    if not district:
+        return ''
+    return region_keys(district, division)[-1]
+
+def results_rows(version, region=''):
+    """
+    Candidate result rows for a tally version and region, sorted by 1st preferences;
+    cached per tally and ballot version
+    """
+    data_key = f"voting:results:data:{version}:{ballot_version()}:{region}"
+    results_data = cache.get(data_key)
+    if results_data is not None:
+        return results_data
     
-    # Fetch all votes once
-    all_votes = Vote.objects.all()
+    candidates_qs = Candidate.objects.only(
+        'id', 'ballot_name', 'full_name', 'party_name', 'color', 'candidate_photo', 'photo_thumbnails'
+    )
+    results_data = []
     
-    # Decrypt votes
-    decrypted_votes = []
-    for vote in all_votes:
-        try:
-            decrypted_data = cipher_suite.decrypt(vote.preferences.encode()).decode()
-            prefs = json.loads(decrypted_data)
-            decrypted_votes.append(prefs)
-        except Exception as e:
-            print(f"Error decrypting vote {vote.id}: {e}")
-            # Skip invalid/unencrypted votes (e.g. from before encryption was added)
-            continue
+    # Read the materialized tally (C x 3 counter rows) instead of decrypting every vote
+    tally = read_counts(region)
     
     for candidate in candidates_qs:
-        c_id = str(candidate.id)
-        counts = {1: 0, 2: 0, 3: 0}
-        
-        for prefs in decrypted_votes:
-            # Check rank 1
-            if prefs.get('1') == c_id:
-                counts[1] += 1
-            # Check rank 2
-            if prefs.get('2') == c_id:
-                counts[2] += 1
-            # Check rank 3
-            if prefs.get('3') == c_id:
-                counts[3] += 1
+        counts = tally.get(str(candidate.id)) or empty_counts()
+        thumbnail = candidate.thumbnails.get('results')
                 
         results_data.append({
+            'id': str(candidate.id),
             'name': candidate.ballot_name or candidate.full_name,
             'party': candidate.party_name or "Independent",
-            'color': get_party_color(candidate.party_name),
+            'color': candidate.color,
+            'photo': thumbnail['jpeg'] if thumbnail else None,
             'counts': counts,
             'total_1st': counts[1]
         })
@@ -124,7 +266,94 @@ def results(request):
     # Sort by 1st preference count descending
     results_data.sort(key=lambda x: x['total_1st'], reverse=True)
     
-    return render(request, 'voting/results.html', {'results': results_data})
+    cache.set(data_key, results_data, settings.RESULTS_PAGE_CACHE_SECONDS)
+    return results_data
+
+@cache_control(no_cache=True)
+@condition(etag_func=results_etag)
+def results(request):
+    # Serve the page rendered for this tally version if another request already built it
+    version = results_version(request)
+    try:
+        region = requested_region(request)
+    except ValidationError as e:
+        return HttpResponseBadRequest(e.messages[0])
+    page_key = f"voting:results:page:{version}:{ballot_version()}:{region}"
+    content = cache.get(page_key)
+    if content is not None:
+        return HttpResponse(content)
+    
+    context = {
+        'results': results_rows(version, region),
+        'district': request.GET.get('district'),
+        'division': request.GET.get('division'),
+        'live_results': settings.VOTING_LIVE_RESULTS,
+    }
+    response = render(request, 'voting/results.html', context)
+    cache.set(page_key, response.content, settings.RESULTS_PAGE_CACHE_SECONDS)
+    return response
+
+@gzip_page
+@cache_control(no_cache=True)
+@condition(etag_func=results_etag)
+def results_api(request):
+    """
+    JSON results for dashboards and media feeds.
+
+    Query parameters:
+        top     only the first N candidates
+        rank    comma-separated ranks to include, e.g. "1" or "1,2"; rows are
+                ordered by the first one listed (default "1,2,3")
+        fields  comma-separated subset of id, name, party, color, photo, counts
+        district, division
+                results for one electoral district / polling division;
+                division needs district
+    """
+    try:
+        top = int(request.GET['top']) if 'top' in request.GET else None
+        ranks = [int(r) for r in request.GET.get('rank', '1,2,3').split(',')]
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'top and rank must be integers'}, status=400)
+    fields = request.GET.get('fields', ','.join(API_FIELDS)).split(',')
+    if (top is not None and top < 0) or not set(ranks) <= {1, 2, 3} or not set(fields) <= set(API_FIELDS):
+        return JsonResponse({'status': 'error', 'message': 'Invalid top, rank or fields'}, status=400)
+    
+    try:
+        region = requested_region(request)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': e.messages[0]}, status=400)
+    version = results_version(request)
+    rows = results_rows(version, region)
+    if ranks[0] != 1:
+        rows = sorted(rows, key=lambda x: x['counts'][ranks[0]], reverse=True)
+    if top is not None:
+        rows = rows[:top]
+    
+    payload = []
+    for row in rows:
+        item = {field: row[field] for field in fields if field != 'counts'}
+        if 'counts' in fields:
+            item['counts'] = {rank: row['counts'][rank] for rank in ranks}
+        payload.append(item)
+    
+    return JsonResponse(
+        {'version': version, 'results': payload},
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+async def results_stream(request):
+    """Server-sent events feed of tally changes for the live results page (ASGI only)"""
+    if not settings.VOTING_LIVE_RESULTS:
+        raise Http404("Live results are not enabled")
+    response = StreamingHttpResponse(results_events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def admission_metrics(request):
+    """Admission control counters and queue depth of this worker process"""
+    return JsonResponse(admission_controller.metrics())
 
 def success(request):
     """Display the trilingual vote submission success page"""